@@ -1,26 +1,74 @@
+import typing as t
+
 from fastapi import APIRouter, Depends
+from starlette.requests import Request
+from starlette.responses import Response
 
-from app.models.db import Faculty, FacultyModel, DepartmentModel, Department, GroupModel, Group, EmployeeModel, Employee
+import config
+from app.models.db import Faculty, Department, Group, Employee
 from app.services.auth import AuthService
+from app.services.cache import CacheService
+from app.services.jobs import JobQueue
+from app.services.schedule import ScheduleService
+from . import schedule
+from .responses import etag_matches, not_modified, json_bytes
 
 router = APIRouter(prefix="/api/v1", dependencies=[Depends(AuthService.requires_authorization)])
+router.include_router(schedule.router)
+
+
+async def _reference_response(request: Request, kind: str, object_id: t.Optional[int] = None) -> Response:
+    etag, body = await CacheService.get(kind, object_id)
+    if etag_matches(request, etag):
+        return not_modified(etag, config.REFERENCE_MAX_AGE)
+    return json_bytes(body, etag, config.REFERENCE_MAX_AGE)
 
 
 @router.get("/faculties", response_model=list[Faculty])
-async def get_faculties():
-    return await Faculty.from_queryset(FacultyModel.all())
+async def get_faculties(request: Request):
+    return await _reference_response(request, "faculties")
 
 
 @router.get("/department/{faculty_id}", response_model=list[Department])
-async def get_departments(faculty_id: int):
-    return await Department.from_queryset(DepartmentModel.filter(faculty_id=faculty_id))
+async def get_departments(request: Request, faculty_id: int):
+    return await _reference_response(request, "departments", faculty_id)
 
 
 @router.get("/employee/{department_id}", response_model=list[Employee])
-async def get_employees(department_id: int):
-    return await Employee.from_queryset(EmployeeModel.filter(department_id=department_id))
+async def get_employees(request: Request, department_id: int):
+    return await _reference_response(request, "employees", department_id)
 
 
 @router.get("/group/{faculty_id}", response_model=list[Group])
-async def get_groups(faculty_id: int):
-    return await Group.from_queryset(GroupModel.filter(faculty_id=faculty_id))
+async def get_groups(request: Request, faculty_id: int):
+    return await _reference_response(request, "groups", faculty_id)
+
+
+@router.get("/stats/cache")
+async def get_cache_stats():
+    return CacheService.stats()
+
+
+@router.get("/stats/fingerprints")
+async def get_fingerprint_stats():
+    return ScheduleService.http.fingerprints.stats()
+
+
+@router.get("/stats/flights")
+async def get_flight_stats():
+    return ScheduleService.http.flights.stats()
+
+
+@router.get("/stats/ingest")
+async def get_ingest_stats():
+    return ScheduleService.ingest.stats() if ScheduleService.ingest else {}
+
+
+@router.get("/stats/jobs")
+async def get_job_stats():
+    return await JobQueue.stats()
+
+
+@router.get("/stats/scheduler")
+async def get_scheduler_stats():
+    return ScheduleService.scheduler.status()
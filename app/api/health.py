@@ -0,0 +1,23 @@
+from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse
+from starlette import status
+
+from app.services.leader import LeaderService
+from app.services.schedule import ScheduleService
+
+router = APIRouter(
+    prefix='/health',
+    tags=['health'],
+)
+
+
+@router.get("/live")
+async def get_liveness():
+    return {"status": "alive"}
+
+
+@router.get("/ready")
+async def get_readiness():
+    service_status = {**ScheduleService.status(), "leader": LeaderService.status()}
+    code = status.HTTP_200_OK if service_status["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE
+    return ORJSONResponse(service_status, status_code=code)
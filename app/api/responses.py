@@ -0,0 +1,27 @@
+import typing as t
+
+from starlette import status
+from starlette.requests import Request
+from starlette.responses import Response
+
+
+def etag_matches(request: Request, etag: t.Optional[str]) -> bool:
+    """Checks If-None-Match of the request against the current ETag"""
+    if etag is None:
+        return False
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+def not_modified(etag: str, max_age: int) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                    headers={"ETag": etag, "Cache-Control": f"private, max-age={max_age}"})
+
+
+def json_bytes(body: bytes, etag: str, max_age: int) -> Response:
+    return Response(content=body, media_type="application/json",
+                    headers={"ETag": etag, "Cache-Control": f"private, max-age={max_age}"})
@@ -1,10 +1,18 @@
+import typing as t
+
 from fastapi import (
     APIRouter,
-    Depends,
+    HTTPException,
+    Query,
+    status,
 )
-from starlette.responses import JSONResponse
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
 
-from app.services.schedule import ScheduleService
+import config
+from app.models.enums import UserType
+from app.services.schedule import ScheduleService, ScheduleUser
+from .responses import etag_matches, not_modified, json_bytes
 
 router = APIRouter(
     prefix='/schedule',
@@ -12,6 +20,76 @@ router = APIRouter(
 )
 
 
+async def _stream_documents(user_type: UserType, ids: list[int], week_delta: int) -> t.AsyncIterator[bytes]:
+    """Streams a JSON object mapping every id to its week, one document at a time"""
+    separator = b"{"
+    async for object_id, document in ScheduleService.iter_schedule_documents(user_type, ids, week_delta):
+        yield separator + b'"%d":' % object_id + document
+        separator = b","
+    yield b"}" if separator == b"," else b"{}"
+
+
+def _batch_response(user_type: UserType, ids: list[int], week_delta: int) -> StreamingResponse:
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > config.BATCH_SCHEDULE_MAX_IDS:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"At most {config.BATCH_SCHEDULE_MAX_IDS} ids per request")
+    return StreamingResponse(_stream_documents(user_type, ids, week_delta), media_type="application/json",
+                             headers={"Cache-Control": f"private, max-age={config.SCHEDULE_MAX_AGE}"})
+
+
+@router.get("/groups")
+async def get_schedule_groups(ids: list[int] = Query(...), week_delta: int = 0):
+    return _batch_response(UserType.Student, ids, week_delta)
+
+
+@router.get("/employees")
+async def get_schedule_employees(ids: list[int] = Query(...), week_delta: int = 0):
+    return _batch_response(UserType.Lecturer, ids, week_delta)
+
+
+async def _week_response(request: Request, user: ScheduleUser, week_delta: int) -> Response:
+    etag = await ScheduleService.get_schedule_etag(user, week_delta)
+    if etag_matches(request, etag):
+        return not_modified(etag, config.SCHEDULE_MAX_AGE)
+
+    snapshot = await ScheduleService.get_schedule_snapshot(user, week_delta)
+    if snapshot is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Schedule not found")
+
+    etag, payload = snapshot
+    if etag_matches(request, etag):
+        return not_modified(etag, config.SCHEDULE_MAX_AGE)
+    return json_bytes(payload, etag, config.SCHEDULE_MAX_AGE)
+
+
 @router.get("/group/{group_id}")
-async def get_schedule_group(group_id: int):
-    pass
\ No newline at end of file
+async def get_schedule_group(request: Request, group_id: int, week_delta: int = 0):
+    return await _week_response(request, ScheduleUser(UserType.Student, group_id), week_delta)
+
+
+@router.get("/employee/{employee_id}")
+async def get_schedule_employee(request: Request, employee_id: int, week_delta: int = 0):
+    return await _week_response(request, ScheduleUser(UserType.Lecturer, employee_id), week_delta)
+
+
+async def _exams_response(request: Request, user: ScheduleUser) -> Response:
+    etag = await ScheduleService.get_exams_etag(user)
+    if etag_matches(request, etag):
+        return not_modified(etag, config.SCHEDULE_MAX_AGE)
+
+    etag, body = await ScheduleService.get_exams_document(user)
+    if etag_matches(request, etag):
+        return not_modified(etag, config.SCHEDULE_MAX_AGE)
+    return json_bytes(body, etag, config.SCHEDULE_MAX_AGE)
+
+
+@router.get("/group/{group_id}/exams")
+async def get_exams_group(request: Request, group_id: int):
+    return await _exams_response(request, ScheduleUser(UserType.Student, group_id))
+
+
+@router.get("/employee/{employee_id}/exams")
+async def get_exams_employee(request: Request, employee_id: int):
+    return await _exams_response(request, ScheduleUser(UserType.Lecturer, employee_id))
+
@@ -6,7 +6,7 @@ from tortoise import fields
 from tortoise.contrib.pydantic import pydantic_model_creator
 from tortoise.models import Model
 
-from app.models.enums import DayType, EducationalLevel, Years, SubjectType, ActionStats
+from app.models.enums import DayType, EducationalLevel, Years, SubjectType, ActionStats, UserType, JobStatus
 
 __all__: typing.Sequence[str] = (
     "ScheduleModel",
@@ -15,10 +15,17 @@ __all__: typing.Sequence[str] = (
     "FacultyModel",
     "GroupModel",
     "StatsModel",
+    "LastUpdateModel",
+    "StatsRollupModel",
     "CookieModel",
+    "CookieRequestModel",
     "UserAgentModel",
     "DepartmentModel",
     "ExamModel",
+    "RateLimitModel",
+    "ScheduleSnapshotModel",
+    "FetchJobModel",
+    "ScheduleReadModel",
     "Faculty",
     "Department",
     'Employee',
@@ -45,6 +52,7 @@ class StatsModel(Model):
     action = fields.IntEnumField(ActionStats)
     datetime = fields.DatetimeField(auto_now_add=True)
     object_id = fields.BigIntField(null=True)
+    duration = fields.FloatField(null=True)
     extra = fields.JSONField(default="{}")
 
     class Meta:
@@ -52,6 +60,88 @@ class StatsModel(Model):
 
         table = "stats"
         table_description = "Stores information about the stats"
+        indexes = (("action", "object_id", "datetime"), ("action", "datetime"))
+
+
+class StatsRollupModel(Model):
+    id = fields.IntField(pk=True)
+    action = fields.IntEnumField(ActionStats)
+    bucket = fields.DatetimeField()
+    count = fields.IntField()
+    duration_sum = fields.FloatField()
+    duration_max = fields.FloatField()
+
+    class Meta:
+        """Metaclass to set table name and description"""
+
+        table = "stats_rollup"
+        table_description = "Stores the stats aggregated per hour or day after their retention"
+        unique_together = ("action", "bucket")
+
+
+class RateLimitModel(Model):
+    key = fields.CharField(max_length=255, pk=True)
+    tat = fields.FloatField()
+
+    class Meta:
+        """Metaclass to set table name and description"""
+
+        table = "ratelimit"
+        table_description = "Stores the ratelimiter buckets shared between workers"
+
+
+class LastUpdateModel(Model):
+    id = fields.IntField(pk=True)
+    action = fields.IntEnumField(ActionStats)
+    object_id = fields.BigIntField(default=0)
+    week = fields.BigIntField(default=0)
+    datetime = fields.DatetimeField()
+
+    class Meta:
+        """Metaclass to set table name and description"""
+
+        table = "last_update"
+        table_description = "Stores the time of the last fetch of every object"
+        unique_together = ("action", "object_id", "week")
+        # The index on "datetime" read by FreshnessIndex.refresh is created by app/models/migrations.py
+
+
+class FetchJobModel(Model):
+    id = fields.BigIntField(pk=True)
+    action = fields.IntEnumField(ActionStats)
+    type = fields.IntEnumField(UserType, default=UserType.Student)
+    object_id = fields.BigIntField(default=0)
+    week = fields.BigIntField(default=0)
+    status = fields.IntEnumField(JobStatus, default=JobStatus.queued)
+    attempts = fields.IntField(default=0)
+    run_at = fields.DatetimeField()
+    locked_until = fields.DatetimeField(null=True)
+    last_error = fields.TextField(null=True)
+    datetime = fields.DatetimeField(auto_now=True)
+
+    class Meta:
+        """Metaclass to set table name and description"""
+
+        table = "fetch_job"
+        table_description = "Stores the queued fetches run by the workers"
+        unique_together = ("action", "type", "object_id", "week")
+        indexes = (("status", "run_at"),)
+
+
+class ScheduleReadModel(Model):
+    id = fields.BigIntField(pk=True)
+    action = fields.IntEnumField(ActionStats)
+    type = fields.IntEnumField(UserType)
+    object_id = fields.BigIntField()
+    week = fields.BigIntField(default=0)
+    reads = fields.IntField(default=0)
+
+    class Meta:
+        """Metaclass to set table name and description"""
+
+        table = "schedule_read"
+        table_description = "Stores the schedule and exam reads of the other workers until the leader counts them"
+        unique_together = ("action", "type", "object_id", "week")
 
 
 class CookieModel(Model):
@@ -66,6 +156,18 @@ class CookieModel(Model):
         table_description = "Stores information about the cookies"
 
 
+class CookieRequestModel(Model):
+    id = fields.BigIntField(pk=True)
+    datetime = fields.DatetimeField(auto_now_add=True)
+    cookie = fields.TextField()
+
+    class Meta:
+        """Metaclass to set table name and description"""
+
+        table = "cookie_request"
+        table_description = "Stores the cookies other workers found rejected, the cookie owner refreshes them"
+
+
 class UserAgentModel(Model):
     id = fields.BigIntField(pk=True)
     datetime = fields.DatetimeField(auto_now_add=True)
@@ -191,6 +293,24 @@ class ScheduleSubjectModel(Model):
         table = "subject"
         table_description = "Stores information about the subject"
         unique_together = (("schedule_id", "employee_id", "number"), ("schedule_id", "group_id", "number"))
+        indexes = (("group_id", "schedule_id"), ("employee_id", "schedule_id"))
+
+
+class ScheduleSnapshotModel(Model):
+    id = fields.IntField(pk=True)
+    type = fields.IntEnumField(UserType)
+    object_id = fields.BigIntField()
+    week = fields.IntField()
+    datetime = fields.DatetimeField(auto_now=True)
+    payload = fields.BinaryField()
+    etag = fields.CharField(max_length=64)
+
+    class Meta:
+        """Metaclass to set table name and description"""
+
+        table = "schedule_snapshot"
+        table_description = "Stores the serialized schedule of a group or an employee for a week"
+        unique_together = ("type", "object_id", "week")
 
 
 class ExamModel(Model):
@@ -219,11 +339,20 @@ class ExamModel(Model):
 
         table = "exam"
         table_description = "Stores information about the exam"
-
-
-Faculty = pydantic_model_creator(FacultyModel, name="Faculty")
-Department = pydantic_model_creator(DepartmentModel, name="Department")
-Group = pydantic_model_creator(GroupModel, name="Group")
-Employee = pydantic_model_creator(FacultyModel, name="Employee")
+        indexes = (("group_id", "date"), ("employee_id", "date"))
+        # The unique key on (date, number, sub_group, group_id, employee_id) is created by
+        # app/models/migrations.py, it has to drop the duplicates of existing tables first
+
+
+# Reference lists are flat rows, the same columns services/reference.py projects with .values()
+Faculty = pydantic_model_creator(FacultyModel, name="Faculty", include=("id", "title", "short_title"))
+Department = pydantic_model_creator(DepartmentModel, name="Department",
+                                    include=("id", "title", "short_title", "faculty_id"), exclude_raw_fields=False)
+Group = pydantic_model_creator(GroupModel, name="Group",
+                               include=("id", "direction", "course", "level", "name", "faculty_id"),
+                               exclude_raw_fields=False)
+Employee = pydantic_model_creator(EmployeeModel, name="Employee",
+                                  include=("id", "name", "second_name", "middle_name", "department_id"),
+                                  exclude_raw_fields=False)
 ScheduleSubject = pydantic_model_creator(ScheduleSubjectModel, name="ScheduleSubject")
 Exam = pydantic_model_creator(ExamModel, name="Exam")
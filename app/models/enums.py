@@ -7,6 +7,7 @@ __all__ = ("UserType",
            "Years",
            "ActionStats",
            "SubjectType",
+           "JobStatus",
            "subject_type_ru",
            "educational_level_ru",
            "try_value",
@@ -52,6 +53,8 @@ class ActionStats(enum.IntEnum):
     fetch_employee = 5
     fetch_data = 6
     fetch_exams = 7
+    ingest_schedules = 8
+    ingest_exams = 9
 
 
 class SubjectType(enum.IntEnum):
@@ -63,6 +66,13 @@ class SubjectType(enum.IntEnum):
     consultation = 5
 
 
+class JobStatus(enum.IntEnum):
+    queued = 0
+    running = 1
+    done = 2
+    failed = 3
+
+
 def try_value(cls, value):
     for name, value_ in cls._member_map_.items():
         if value_.value == int(value):
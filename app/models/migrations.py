@@ -0,0 +1,39 @@
+import typing as t
+
+from loguru import logger
+from tortoise import Tortoise
+
+__all__: t.Sequence[str] = ("MIGRATIONS", "migrate")
+
+# Changes to tables that already exist in deployed databases, generate_schemas only creates missing tables.
+# Every statement must be idempotent, they all run on each startup with API_MIGRATE.
+MIGRATIONS: t.Sequence[str] = (
+    'ALTER TABLE "stats" ADD COLUMN IF NOT EXISTS "duration" DOUBLE PRECISION',
+    # Exams are matched on these columns by ScheduleService._exam_key and the COPY merge,
+    # duplicates left by concurrent merges are removed once, before the key is created
+    "DO $$ BEGIN "
+    "IF to_regclass('\"uid_exam_match\"') IS NULL THEN "
+    'DELETE FROM "exam" a USING "exam" b WHERE a."id" > b."id" '
+    'AND a."date" = b."date" AND a."number" = b."number" AND a."sub_group" = b."sub_group" '
+    'AND a."group_id" = b."group_id" AND a."employee_id" = b."employee_id"; '
+    'CREATE UNIQUE INDEX "uid_exam_match" ON "exam" ("date", "number", "sub_group", "group_id", "employee_id"); '
+    "END IF; "
+    "END $$",
+    'CREATE INDEX IF NOT EXISTS "idx_last_update_datetime" ON "last_update" ("datetime")',
+    # Schedule fetches are tracked per week, the (action, object_id) key of older tables is widened
+    'ALTER TABLE "last_update" ADD COLUMN IF NOT EXISTS "week" BIGINT NOT NULL DEFAULT 0',
+    "DO $$ DECLARE c text; BEGIN "
+    "SELECT conname INTO c FROM pg_constraint "
+    "WHERE conrelid = '\"last_update\"'::regclass AND contype = 'u' AND array_length(conkey, 1) = 2; "
+    "IF c IS NOT NULL THEN EXECUTE format('ALTER TABLE \"last_update\" DROP CONSTRAINT %I', c); END IF; "
+    "END $$",
+    'CREATE UNIQUE INDEX IF NOT EXISTS "uid_last_update_week" ON "last_update" ("action", "object_id", "week")',
+)
+
+
+async def migrate() -> None:
+    """Applies MIGRATIONS, after generate_schemas has created the missing tables"""
+    connection = Tortoise.get_connection("default")
+    for statement in MIGRATIONS:
+        await connection.execute_script(statement)
+    logger.info("Applied {} migrations", len(MIGRATIONS))
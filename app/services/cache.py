@@ -0,0 +1,88 @@
+import datetime
+import hashlib
+import typing as t
+
+import orjson
+from cashews import cache
+
+import config
+from app.services.reference import load_models, load_values
+
+
+class CacheService:
+    """Read-through cache of the reference data responses.
+
+    Entries are the serialized body together with its ETag. ScheduleService.fetch_*
+    rebuilds an entry right after writing new data, so the ETag is computed once per change.
+
+    A mem:// cache belongs to its process: the other workers drop their entries once they see the
+    change in the freshness index, and ETags of data kept elsewhere are not trusted (see ``shared``).
+    """
+
+    # Whether every worker reads and writes the same cache, e.g. redis://
+    shared: bool = not config.CACHE_URL.startswith("mem://")
+    hits: int = 0
+    misses: int = 0
+
+    ttl: dict[str, datetime.timedelta] = {
+        "faculties": config.UPDATE_FETCH_FACULTIES,
+        "departments": config.UPDATE_FETCH_DEPARTMENTS,
+        "employees": config.UPDATE_FETCH_EMPLOYEES,
+        "groups": config.UPDATE_FETCH_GROUPS,
+        "schedule": config.UPDATE_FETCH_SCHEDULE,
+        "exams": config.UPDATE_FETCH_EXAMS,
+    }
+
+    @staticmethod
+    def key(kind: str, object_id: t.Optional[t.Any] = None) -> str:
+        return kind if object_id is None else f"{kind}:{object_id}"
+
+    @staticmethod
+    def make_etag(body: bytes) -> str:
+        return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+    @classmethod
+    async def _build(cls, kind: str, object_id: t.Optional[int]) -> tuple[str, bytes]:
+        load = load_values if config.FAST_RESPONSES else load_models
+        body = orjson.dumps(await load(kind, object_id))
+        entry = (cls.make_etag(body), body)
+        await cache.set(cls.key(kind, object_id), entry, expire=cls.ttl[kind])
+        return entry
+
+    @classmethod
+    async def get(cls, kind: str, object_id: t.Optional[int] = None) -> tuple[str, bytes]:
+        """Returns the ETag and the body of a reference list"""
+        entry = await cache.get(cls.key(kind, object_id))
+        if entry is not None:
+            cls.hits += 1
+            return entry
+
+        cls.misses += 1
+        return await cls._build(kind, object_id)
+
+    @classmethod
+    async def get_etag(cls, kind: str, object_id: t.Any) -> t.Optional[str]:
+        """Returns the ETag of data not kept in the cache itself, e.g. schedule snapshots"""
+        return await cache.get(cls.key(f"etag:{kind}", object_id))
+
+    @classmethod
+    async def set_etag(cls, kind: str, object_id: t.Any, etag: str) -> None:
+        await cache.set(cls.key(f"etag:{kind}", object_id), etag, expire=cls.ttl[kind])
+
+    @classmethod
+    async def forget_etag(cls, kind: str, object_id: t.Any) -> None:
+        await cache.delete(cls.key(f"etag:{kind}", object_id))
+
+    @classmethod
+    async def drop(cls, kind: str, object_id: t.Optional[int] = None) -> None:
+        """Forgets the entry, the next read builds it again"""
+        await cache.delete(cls.key(kind, object_id))
+
+    @classmethod
+    async def invalidate(cls, kind: str, object_id: t.Optional[int] = None) -> None:
+        """Rebuilds the entry after its data has changed"""
+        await cls._build(kind, object_id)
+
+    @classmethod
+    def stats(cls) -> dict[str, int]:
+        return {"hits": cls.hits, "misses": cls.misses}
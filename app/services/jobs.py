@@ -0,0 +1,143 @@
+import random
+import typing as t
+from datetime import datetime
+
+import config
+from app.models.db import FetchJobModel
+from app.models.enums import ActionStats, JobStatus, UserType
+
+__all__: t.Sequence[str] = ("FetchJob", "JobQueue")
+
+_ENQUEUE = (
+    'INSERT INTO "fetch_job" AS j ("action", "type", "object_id", "week", "status", "attempts", "run_at", "datetime") '
+    f"SELECT *, {JobStatus.queued.value}, 0, now(), now() "
+    "FROM unnest($1::smallint[], $2::smallint[], $3::bigint[], $4::bigint[]) "
+    'ON CONFLICT ("action", "type", "object_id", "week") DO UPDATE '
+    f'SET "status" = {JobStatus.queued.value}, "attempts" = 0, "run_at" = now(), "last_error" = NULL, '
+    '"datetime" = now() '
+    f'WHERE j."status" IN ({JobStatus.done.value}, {JobStatus.failed.value}) '
+    'RETURNING j."id"'
+)
+# Running jobs whose lease expired belong to a crashed worker and are taken again.
+# The statement starts with WITH: Tortoise runs statements starting with UPDATE or DELETE
+# through connection.execute, which drops the RETURNING rows.
+_DEQUEUE = (
+    'WITH picked AS ('
+    'SELECT "id" FROM "fetch_job" '
+    f'WHERE ("status" = {JobStatus.queued.value} AND "run_at" <= now()) '
+    f'OR ("status" = {JobStatus.running.value} AND "locked_until" < now()) '
+    'ORDER BY "run_at" LIMIT $1 FOR UPDATE SKIP LOCKED'
+    ') '
+    f'UPDATE "fetch_job" j SET "status" = {JobStatus.running.value}, "attempts" = j."attempts" + 1, '
+    '"locked_until" = now() + make_interval(secs => $2::float8), "datetime" = now() '
+    'FROM picked WHERE j."id" = picked."id" '
+    'RETURNING j."id", j."action", j."type", j."object_id", j."week", j."attempts"'
+)
+_COMPLETE = (
+    f'UPDATE "fetch_job" SET "status" = {JobStatus.done.value}, "locked_until" = NULL, "last_error" = NULL, '
+    '"datetime" = now() '
+    f'WHERE "id" = $1 AND "status" = {JobStatus.running.value}'
+)
+_FAIL = (
+    f'UPDATE "fetch_job" SET "status" = CASE WHEN $2::boolean THEN {JobStatus.failed.value} '
+    f'ELSE {JobStatus.queued.value} END, '
+    '"run_at" = now() + make_interval(secs => $3::float8), "locked_until" = NULL, "last_error" = $4, '
+    '"datetime" = now() '
+    f'WHERE "id" = $1 AND "status" = {JobStatus.running.value}'
+)
+_STATS = 'SELECT "status", count(*) FROM "fetch_job" GROUP BY "status"'
+_BATCH_STATS = (
+    'SELECT "status", count(*) FROM "fetch_job" '
+    'WHERE "action" = $1 AND "type" = $2 AND "week" = $3 AND "object_id" = ANY($4::bigint[]) GROUP BY "status"'
+)
+_PRUNE = (
+    f'DELETE FROM "fetch_job" WHERE "status" IN ({JobStatus.done.value}, {JobStatus.failed.value}) '
+    'AND "datetime" < $1'
+)
+
+
+class FetchJob(t.NamedTuple):
+    id: int
+    action: ActionStats
+    type: UserType
+    object_id: int
+    week: int
+    attempts: int
+
+
+class JobQueue:
+    """Durable queue of fetches in the fetch_job table, run by ``python -m app.worker``.
+
+    A job is unique per (action, type, object_id, week): enqueueing one that is queued or running
+    is a no-op, a finished one is queued again. Workers take jobs with FOR UPDATE SKIP LOCKED and
+    hold them for JOB_LEASE seconds, failed jobs are retried with exponential backoff.
+    """
+
+    @classmethod
+    async def enqueue(
+            cls,
+            action: ActionStats,
+            user_type: UserType = UserType.Student,
+            object_id: int = 0,
+            week: int = 0
+    ) -> bool:
+        """Returns False if the same job is already waiting"""
+        return await cls.enqueue_many([(action, user_type, object_id, week)]) == 1
+
+    @classmethod
+    async def enqueue_many(cls, jobs: t.Iterable[tuple[ActionStats, UserType, int, int]]) -> int:
+        """Queues jobs in one statement, returns how many were not already waiting"""
+        # One statement must not upsert the same row twice
+        jobs = list(dict.fromkeys(jobs))
+        if not jobs:
+            return 0
+        actions, types, object_ids, weeks = zip(*jobs)
+        _, rows = await FetchJobModel._meta.db.execute_query(
+            _ENQUEUE, [[a.value for a in actions], [u.value for u in types], list(object_ids), list(weeks)])
+        return len(rows)
+
+    @classmethod
+    async def dequeue(cls, limit: int) -> list[FetchJob]:
+        _, rows = await FetchJobModel._meta.db.execute_query(_DEQUEUE, [limit, config.JOB_LEASE])
+        return [FetchJob(row["id"], ActionStats(row["action"]), UserType(row["type"]), row["object_id"],
+                         row["week"], row["attempts"]) for row in rows]
+
+    @classmethod
+    async def complete(cls, job: FetchJob) -> None:
+        await FetchJobModel._meta.db.execute_query(_COMPLETE, [job.id])
+
+    @classmethod
+    async def fail(cls, job: FetchJob, error: str) -> None:
+        """Queues the job again after a backoff, or gives up after JOB_MAX_ATTEMPTS"""
+        give_up = job.attempts >= config.JOB_MAX_ATTEMPTS
+        backoff = min(config.JOB_RETRY_BASE * 2 ** (job.attempts - 1), config.JOB_RETRY_MAX)
+        await FetchJobModel._meta.db.execute_query(
+            _FAIL, [job.id, give_up, backoff * random.uniform(0.8, 1.2), error])
+
+    @classmethod
+    async def batch_stats(
+            cls,
+            action: ActionStats,
+            user_type: UserType,
+            object_ids: t.Sequence[int],
+            week: int = 0
+    ) -> dict[str, int]:
+        """Counts per status of the jobs of one enqueue_many batch"""
+        _, rows = await FetchJobModel._meta.db.execute_query(
+            _BATCH_STATS, [action.value, user_type.value, week, list(object_ids)])
+        counts = {status.name: 0 for status in JobStatus}
+        counts.update({JobStatus(row[0]).name: row[1] for row in rows})
+        return counts
+
+    @classmethod
+    async def prune(cls, before: datetime) -> int:
+        """Deletes the jobs finished before the moment, returns how many"""
+        count, _ = await FetchJobModel._meta.db.execute_query(_PRUNE, [before])
+        return count
+
+    @classmethod
+    async def stats(cls) -> dict[str, int]:
+        _, rows = await FetchJobModel._meta.db.execute_query(_STATS)
+        counts = {status.name: 0 for status in JobStatus}
+        counts.update({JobStatus(row[0]).name: row[1] for row in rows})
+        return counts
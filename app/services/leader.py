@@ -0,0 +1,104 @@
+import asyncio
+import contextlib
+import typing as t
+from datetime import datetime
+
+import pytz
+from loguru import logger
+from tortoise import Tortoise
+
+import config
+
+Callback = t.Callable[[], t.Awaitable[None]]
+
+
+class LeaderService:
+    """Elects the one worker of the deployment that runs the background work.
+
+    The leader holds a session-level Postgres advisory lock on a connection taken from the tortoise pool
+    and checks it is alive every LEADER_CHECK_INTERVAL. The other workers try to take the lock as often;
+    when the leader dies its session ends, the lock is released and one of them takes over.
+    """
+
+    is_leader: bool = False
+    elected_at: t.Optional[datetime] = None
+    task: t.Optional[asyncio.Task] = None
+
+    _lock: t.Optional[contextlib.AsyncExitStack] = None
+    _connection = None
+    _on_elected: t.Optional[Callback] = None
+    _on_demoted: t.Optional[Callback] = None
+
+    @classmethod
+    def start(cls, on_elected: Callback, on_demoted: Callback) -> None:
+        cls._on_elected = on_elected
+        cls._on_demoted = on_demoted
+        if cls.task is None:
+            cls.task = asyncio.create_task(cls._run())
+
+    @classmethod
+    async def stop(cls) -> None:
+        if cls.task is not None:
+            cls.task.cancel()
+            cls.task = None
+        await cls._demote()
+
+    @classmethod
+    async def _run(cls) -> None:
+        while True:
+            try:
+                if cls.is_leader:
+                    await asyncio.wait_for(cls._connection.fetchval("SELECT 1"), config.LEADER_CHECK_INTERVAL)
+                elif await cls._try_lock():
+                    cls.is_leader = True
+                    cls.elected_at = datetime.now(pytz.utc)
+                    logger.info("Elected as the leader")
+                    await cls._on_elected()
+            except Exception:
+                logger.exception("Lost the leader lock")
+                await cls._demote()
+            await asyncio.sleep(config.LEADER_CHECK_INTERVAL)
+
+    @classmethod
+    async def _try_lock(cls) -> bool:
+        lock = contextlib.AsyncExitStack()
+        connection = await lock.enter_async_context(Tortoise.get_connection("default").acquire_connection())
+        try:
+            locked = await connection.fetchval("SELECT pg_try_advisory_lock($1)", config.LEADER_LOCK_ID)
+        except Exception:
+            await lock.aclose()
+            raise
+        if not locked:
+            await lock.aclose()
+            return False
+
+        cls._lock, cls._connection = lock, connection
+        return True
+
+    @classmethod
+    async def _demote(cls) -> None:
+        """Stops the background work first, then gives the lock back"""
+        if cls.is_leader:
+            cls.is_leader = False
+            cls.elected_at = None
+            logger.info("Stepping down as the leader")
+            try:
+                await cls._on_demoted()
+            except Exception:
+                logger.exception("Failed to stop the leader work")
+
+        if cls._lock is not None:
+            lock, connection, cls._lock, cls._connection = cls._lock, cls._connection, None, None
+            try:
+                await connection.execute("SELECT pg_advisory_unlock($1)", config.LEADER_LOCK_ID)
+            except Exception:
+                # A pooled session must never keep the lock, closing it releases the lock
+                connection.terminate()
+            try:
+                await lock.aclose()
+            except Exception:
+                logger.exception("Failed to return the leader connection to the pool")
+
+    @classmethod
+    def status(cls) -> dict[str, t.Any]:
+        return {"is_leader": cls.is_leader, "elected_at": cls.elected_at}
@@ -0,0 +1,52 @@
+import typing as t
+
+from tortoise.models import Model
+from tortoise.queryset import QuerySet
+
+from app.models.db import (Faculty,
+                           FacultyModel,
+                           Department,
+                           DepartmentModel,
+                           Employee,
+                           EmployeeModel,
+                           Group,
+                           GroupModel,
+                           )
+
+__all__: t.Sequence[str] = ("REFERENCES", "load_models", "load_values")
+
+
+class Reference(t.NamedTuple):
+    model: t.Type[Model]
+    schema: t.Any
+    scope: t.Optional[str]
+
+    @property
+    def fields(self) -> t.Tuple[str, ...]:
+        """Columns of the response, exactly the fields of the pydantic schema"""
+        return tuple(self.schema.__fields__)
+
+
+REFERENCES: dict[str, Reference] = {
+    "faculties": Reference(FacultyModel, Faculty, None),
+    "departments": Reference(DepartmentModel, Department, "faculty_id"),
+    "employees": Reference(EmployeeModel, Employee, "department_id"),
+    "groups": Reference(GroupModel, Group, "faculty_id"),
+}
+
+
+def _queryset(kind: str, object_id: t.Optional[int]) -> QuerySet:
+    reference = REFERENCES[kind]
+    if reference.scope is None:
+        return reference.model.all().order_by("id")
+    return reference.model.filter(**{reference.scope: object_id}).order_by("id")
+
+
+async def load_models(kind: str, object_id: t.Optional[int] = None) -> list[dict[str, t.Any]]:
+    """Loads a reference list through ORM instances and the pydantic schema"""
+    return [model.dict() for model in await REFERENCES[kind].schema.from_queryset(_queryset(kind, object_id))]
+
+
+async def load_values(kind: str, object_id: t.Optional[int] = None) -> list[dict[str, t.Any]]:
+    """Loads a reference list as plain rows of its columns, no model instances are built"""
+    return await _queryset(kind, object_id).values(*REFERENCES[kind].fields)
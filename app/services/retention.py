@@ -0,0 +1,83 @@
+import asyncio
+import typing as t
+from datetime import datetime
+
+import pytz
+from loguru import logger
+from tortoise.transactions import in_transaction
+
+import config
+from app.models.enums import ActionStats
+from app.services.jobs import JobQueue
+
+_ROLLUP = (
+    'INSERT INTO "stats_rollup" ("action", "bucket", "count", "duration_sum", "duration_max") '
+    "SELECT \"action\", date_trunc('{bucket}', \"datetime\"), count(*), "
+    'coalesce(sum("duration"), 0), coalesce(max("duration"), 0) '
+    'FROM "stats" WHERE "action" = $1 AND "datetime" < $2 '
+    "GROUP BY 1, 2 "
+    'ON CONFLICT ("action", "bucket") DO UPDATE '
+    'SET "count" = "stats_rollup"."count" + EXCLUDED."count", '
+    '"duration_sum" = "stats_rollup"."duration_sum" + EXCLUDED."duration_sum", '
+    '"duration_max" = GREATEST("stats_rollup"."duration_max", EXCLUDED."duration_max")'
+)
+_PRUNE = 'DELETE FROM "stats" WHERE "action" = $1 AND "datetime" < $2'
+
+
+class RetentionService:
+    """Keeps the stats table bounded: rows past their retention are rolled up and deleted.
+
+    Finished fetch_job rows are deleted after JOB_RETENTION as well.
+    """
+
+    task: t.Optional[asyncio.Task] = None
+
+    @classmethod
+    def start(cls) -> None:
+        if cls.task is None:
+            cls.task = asyncio.create_task(cls._run())
+
+    @classmethod
+    def stop(cls) -> None:
+        if cls.task is not None:
+            cls.task.cancel()
+            cls.task = None
+
+    @classmethod
+    async def _run(cls) -> None:
+        while True:
+            try:
+                await cls.prune()
+            except Exception:
+                logger.exception("Failed to prune stats")
+            try:
+                await cls.prune_jobs()
+            except Exception:
+                logger.exception("Failed to prune fetch jobs")
+            await asyncio.sleep(config.STATS_PRUNE_INTERVAL.total_seconds())
+
+    @classmethod
+    async def prune(cls) -> dict[ActionStats, int]:
+        """Rolls up and deletes expired rows of every action, each action in its own transaction"""
+        if config.STATS_ROLLUP_BUCKET not in ("hour", "day"):
+            raise ValueError(f"Unsupported rollup bucket {config.STATS_ROLLUP_BUCKET!r}")
+
+        rollup = _ROLLUP.format(bucket=config.STATS_ROLLUP_BUCKET)
+        now = datetime.now(pytz.utc)
+        pruned: dict[ActionStats, int] = {}
+        for action in ActionStats:
+            cutoff = now - config.STATS_RETENTION.get(action, config.STATS_RETENTION_DEFAULT)
+            async with in_transaction() as conn:
+                await conn.execute_query(rollup, [action.value, cutoff])
+                pruned[action], _ = await conn.execute_query(_PRUNE, [action.value, cutoff])
+
+        logger.info("Pruned stats {}", {action.name: count for action, count in pruned.items() if count})
+        return pruned
+
+    @classmethod
+    async def prune_jobs(cls) -> int:
+        """Deletes the done and failed fetch jobs past JOB_RETENTION"""
+        pruned = await JobQueue.prune(datetime.now(pytz.utc) - config.JOB_RETENTION)
+        if pruned:
+            logger.info("Pruned {} fetch jobs", pruned)
+        return pruned
@@ -1,17 +1,35 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
+import functools
+import operator
+import time
+import typing
 from datetime import datetime
 
 import pytz
 from loguru import logger
 from tortoise.expressions import Q
-from tortoise.query_utils import Prefetch
+from tortoise.transactions import in_transaction
 
 import config
+from app.services.cache import CacheService
+from app.services.jobs import JobQueue
 from .api import HTTPClient
+from .models import ScheduleDayHTTP, ScheduleEntryHTTP
+from .queries import BATCH_WEEK_DOCUMENTS, EXAMS_DOCUMENT, WEEK_DOCUMENT, WEEK_ROWS, owner_column
+from .bulk import IngestPipeline
+from .crawler import ReferenceCrawler
+from .fingerprint import UNCHANGED
+from .freshness import FreshnessIndex, FreshnessMark
+from .reads import ReadLog
+from .ingest import sync_rows, SyncResult
+from .scheduler import RefreshScheduler
+from .snapshot import build_exams_document, build_week_document, build_week_snapshot
 
 from app.utils.time import ScheduleTime
-from app.models.enums import ActionStats, Years, DayType, UserType
+from app.models.enums import ActionStats, Years, DayType, UserType, SubjectType, EducationalLevel
 from app.models.db import (ScheduleModel,
                            ScheduleSubjectModel,
                            StatsModel,
@@ -19,40 +37,330 @@ from app.models.db import (ScheduleModel,
                            DepartmentModel,
                            EmployeeModel,
                            GroupModel,
-                           ExamModel
+                           ExamModel,
+                           ScheduleSnapshotModel
                            )
 
 
+# Reference lists cached by CacheService, per the action that fetches them
+_REFERENCE_KINDS: dict[ActionStats, str] = {
+    ActionStats.fetch_faculties: "faculties",
+    ActionStats.fetch_departments: "departments",
+    ActionStats.fetch_employees: "employees",
+    ActionStats.fetch_groups: "groups",
+}
+
+
+class ScheduleUser(typing.NamedTuple):
+    """Owner of a schedule: a group or an employee"""
+
+    type: UserType
+    object_id: int
+
+    @property
+    def id(self) -> int:
+        return self.object_id
+
+    @property
+    def group_id(self) -> typing.Optional[int]:
+        return self.object_id if self.type == UserType.Student else None
+
+    @property
+    def employee_id(self) -> typing.Optional[int]:
+        return self.object_id if self.type == UserType.Lecturer else None
+
+
 class ScheduleService:
     http: HTTPClient = None
+    crawler: ReferenceCrawler = None
+    crawl_task: typing.Optional[asyncio.Task] = None
+    crawl_attempts: int = 0
+    crawl_error: typing.Optional[str] = None
+    ingest_task: typing.Optional[asyncio.Task] = None
+    share_task: typing.Optional[asyncio.Task] = None
+    scheduler: RefreshScheduler = None
+    ingest: IngestPipeline = None
+    freshness: FreshnessIndex = FreshnessIndex()
+    # Schedule rows are never deleted, a week resolves its ids once per process
+    schedule_ids: dict[tuple[DayType, int], int] = {}
 
     @classmethod
     async def init(cls):
         cls.http = HTTPClient()
         await cls.http.initialize()
-        last_update = await StatsModel.filter(action=ActionStats.fetch_data).order_by("-datetime").first()
-        if not last_update or await cls._check_update(ActionStats.fetch_data):
-            await cls._update_data()
+        if config.BULK_INGEST:
+            cls.ingest = IngestPipeline(config.INGEST_BATCH_ROWS, config.INGEST_FLUSH_DELAY, config.INGEST_MAX_PENDING)
+            cls.ingest.start()
+        cls.scheduler = RefreshScheduler(cls, config.SCHEDULER_CONCURRENCY)
+        await cls.freshness.load()
+        cls.share_task = asyncio.create_task(cls._share_state())
+
+    @classmethod
+    async def lead(cls):
+        """Takes over the crawls, cookie refresh and scheduled fetches, on the worker elected by LeaderService"""
+        cls.http.set_cookie_owner(True)
+        cls.scheduler.start()
+        # Pick up what the previous leader fetched
+        await cls.freshness.refresh()
+        # Reads are served from the stored data meanwhile
+        if await cls._check_update(ActionStats.fetch_data):
+            cls.crawl_task = asyncio.create_task(cls._supervise_crawl())
+        if config.INGEST_INTERVAL:
+            cls.ingest_task = asyncio.create_task(cls._supervise_ingest())
+
+    @classmethod
+    def follow(cls):
+        """Gives the background work up"""
+        if cls.crawl_task:
+            cls.crawl_task.cancel()
+            cls.crawl_task = None
+        if cls.ingest_task:
+            cls.ingest_task.cancel()
+            cls.ingest_task = None
+        if cls.scheduler:
+            cls.scheduler.stop()
+        if cls.http:
+            cls.http.set_cookie_owner(False)
+
+    @classmethod
+    async def shutdown(cls):
+        cls.follow()
+        if cls.share_task:
+            cls.share_task.cancel()
+            cls.share_task = None
+        if cls.ingest:
+            await cls.ingest.stop()
+        if cls.http:
+            await cls.http.shutdown()
+
+    @classmethod
+    def week_bounds(cls, week_delta: int) -> tuple[int, int]:
+        """Half-open [start, end) range of the week, end being the start of the next one"""
+        return (ScheduleTime.compute_timestamp(week_delta=week_delta),
+                ScheduleTime.compute_timestamp(week_delta=week_delta + 1))
 
     @classmethod
     def timestamp_q(cls, week_delta: int):
-        if week_delta < 0:
-            return (Q(date__gte=ScheduleTime.compute_timestamp(week_delta=week_delta + 1))
-                    & Q(date__lte=ScheduleTime.compute_timestamp(week_delta=week_delta)))
-        else:
-            return (Q(date__gte=ScheduleTime.compute_timestamp(week_delta=week_delta))
-                    & Q(date__lte=ScheduleTime.compute_timestamp(week_delta=week_delta + 1)))
+        start, end = cls.week_bounds(week_delta)
+        return Q(date__gte=start) & Q(date__lt=end)
+
+    @classmethod
+    def _track_payloads(cls, with_save: bool) -> typing.ContextManager:
+        """Skips unchanged upstream payloads, only when the result is going to be saved"""
+        return cls.http.fingerprints.track() if with_save else contextlib.nullcontext()
 
     @classmethod
     async def _update_data(cls):
-        faculties = await cls.fetch_faculties()
-        for faculty in faculties:
-            departments = await cls.fetch_departments(faculty.id)
-            for department in departments:
-                await cls.fetch_employees(department.id)
-            await cls.fetch_groups(faculty.id)
+        concurrency = min(config.CRAWL_CONCURRENCY, cls.http.max_connections)
+        cls.crawler = ReferenceCrawler(cls, concurrency)
+        progress = await cls.crawler.run()
+
+        await cls._record(ActionStats.fetch_data, started=time.monotonic() - progress.elapsed,
+                          extra={"failures": progress.to_dict()["failures"]})
+
+    @classmethod
+    async def _supervise_crawl(cls):
+        """Runs the data crawl in the background, retrying it until it completes"""
+        while True:
+            cls.crawl_attempts += 1
+            try:
+                await cls._update_data()
+            except Exception as ex:
+                cls.crawl_error = repr(ex)
+                logger.exception("Data crawl attempt {} failed", cls.crawl_attempts)
+                await asyncio.sleep(config.CRAWL_RETRY_DELAY.total_seconds())
+            else:
+                cls.crawl_error = None
+                return
+
+    @classmethod
+    async def _supervise_ingest(cls):
+        """Fetches the INGEST_WEEKS and the exams of every group each INGEST_INTERVAL, once the data crawl is done"""
+        while True:
+            if cls.crawl_task is not None and not cls.crawl_task.done():
+                await asyncio.wait({cls.crawl_task})
+                continue
+            for week_delta in config.INGEST_WEEKS:
+                try:
+                    await cls.ingest_schedules(week_delta)
+                except Exception:
+                    logger.exception("Failed to ingest the {} week of all groups", week_delta)
+            try:
+                await cls.ingest_exams()
+            except Exception:
+                logger.exception("Failed to ingest the exams of all groups")
+            await asyncio.sleep(config.INGEST_INTERVAL.total_seconds())
+
+    @classmethod
+    async def _share_state(cls):
+        """Brings the state every worker keeps in memory in line with the other workers"""
+        while True:
+            await asyncio.sleep(config.SHARED_STATE_INTERVAL)
+            try:
+                await cls._sync_shared_state()
+            except Exception:
+                logger.exception("Failed to sync the state shared between workers")
+
+    @classmethod
+    async def _sync_shared_state(cls):
+        """Loads the fetches of the other workers and hands the reads of the followers to the leader"""
+        for action, object_id, _ in await cls.freshness.refresh():
+            kind = _REFERENCE_KINDS.get(action)
+            if kind is not None and not CacheService.shared:
+                await CacheService.drop(kind, object_id or None)
+
+        forwarded = cls.scheduler.take_forwarded()
+        if not cls.scheduler.running:
+            await ReadLog.add({
+                (action, user_type, object_id,
+                 ScheduleTime.compute_timestamp(week_delta=week_delta) if action == ActionStats.fetch_schedule else 0):
+                    reads
+                for (action, user_type, object_id, week_delta), reads in forwarded.items()
+            })
+            return
+
+        for (action, user_type, object_id, week_delta), reads in forwarded.items():
+            cls.scheduler.touch(ScheduleUser(user_type, object_id), action, week_delta, reads)
+        for action, user_type, object_id, week, reads in await ReadLog.drain():
+            week_delta = ScheduleTime.week_delta_of(week) if action == ActionStats.fetch_schedule else 0
+            cls.scheduler.touch(ScheduleUser(user_type, object_id), action, week_delta, reads)
+
+    @classmethod
+    def status(cls) -> dict[str, typing.Any]:
+        """Readiness of the service: it is ready once it is initialized and has reference data to serve"""
+        has_data = cls.freshness.get(ActionStats.fetch_faculties) is not None
+        return {
+            "ready": cls.http is not None and has_data,
+            "has_data": has_data,
+            "crawl": {
+                "running": cls.crawl_task is not None and not cls.crawl_task.done(),
+                "attempts": cls.crawl_attempts,
+                "error": cls.crawl_error,
+                "progress": cls.crawler.progress.to_dict() if cls.crawler else None,
+            },
+        }
+
+    @classmethod
+    async def _fetch_all_groups(cls, fetch: typing.Callable[[ScheduleUser], typing.Awaitable]) -> tuple[int, int]:
+        """Runs a fetch for every group, returns the number of groups and of failed ones"""
+        semaphore = asyncio.Semaphore(min(config.CRAWL_CONCURRENCY, cls.http.max_connections))
+
+        async def limited(group_id: int) -> None:
+            async with semaphore:
+                await fetch(ScheduleUser(UserType.Student, group_id))
+
+        group_ids = await GroupModel.all().values_list("id", flat=True)
+        results = await asyncio.gather(*(limited(group_id) for group_id in group_ids), return_exceptions=True)
+        return len(group_ids), sum(isinstance(result, Exception) for result in results)
+
+    @classmethod
+    async def _queue_all_groups(cls, action: ActionStats, week: int = 0) -> tuple[int, int]:
+        """Queues a fetch of every group for the workers and waits for the batch to finish.
+
+        Returns the number of groups and of the jobs that failed for good.
+        """
+        group_ids = await GroupModel.all().values_list("id", flat=True)
+        queued = await JobQueue.enqueue_many((action, UserType.Student, group_id, week) for group_id in group_ids)
+        logger.info("Queued {} of {} groups, {} were already waiting", action.name, len(group_ids),
+                    len(group_ids) - queued)
+        while True:
+            counts = await JobQueue.batch_stats(action, UserType.Student, group_ids, week)
+            if not counts["queued"] and not counts["running"]:
+                return len(group_ids), counts["failed"]
+            await asyncio.sleep(config.JOB_POLL_INTERVAL)
+
+    @classmethod
+    async def ingest_schedules(cls, week_delta: int = 0) -> int:
+        """Fetches the week of every group, the COPY buffers merge them in large batches.
+
+        A week every group was fetched for is recorded, employee weeks are then derived from it.
+        With FETCH_JOBS the fetches are queued for the workers, and recorded once all of them are done.
+
+        Returns the number of groups that failed.
+        """
+        week = ScheduleTime.compute_timestamp(week_delta=week_delta)
+        started = time.monotonic()
+        if config.FETCH_JOBS:
+            total, failed = await cls._queue_all_groups(ActionStats.fetch_schedule, week)
+        else:
+            total, failed = await cls._fetch_all_groups(lambda user: cls.fetch_schedule(user, week_delta=week_delta))
+        if total and not failed:
+            await cls._record(ActionStats.ingest_schedules, week, started=started)
+        logger.info("Ingested {} week of {} groups in {:.2f}s, {} failed",
+                    week_delta, total, time.monotonic() - started, failed)
+        return failed
+
+    @classmethod
+    async def ingest_exams(cls) -> int:
+        """Fetches the exams of every group, employee exams are then derived from them.
+
+        Returns the number of groups that failed.
+        """
+        started = time.monotonic()
+        if config.FETCH_JOBS:
+            total, failed = await cls._queue_all_groups(ActionStats.fetch_exams)
+        else:
+            total, failed = await cls._fetch_all_groups(cls.fetch_exams)
+        if total and not failed:
+            await cls._record(ActionStats.ingest_exams, started=started)
+        logger.info("Ingested exams of {} groups in {:.2f}s, {} failed", total, time.monotonic() - started, failed)
+        return failed
+
+    @classmethod
+    def _covered_by_groups(cls, action: ActionStats, object_id: typing.Optional[int] = None) -> bool:
+        """Whether every group was fetched recently enough to derive employee data from the stored rows"""
+        if not config.DERIVE_EMPLOYEE_DATA:
+            return False
+        max_age = config.UPDATE_FETCH_EXAMS if action == ActionStats.ingest_exams else config.UPDATE_FETCH_SCHEDULE
+        crawled_at = cls.freshness.get(action, object_id)
+        return crawled_at is not None and crawled_at >= datetime.now(pytz.utc) - max_age
+
+    @classmethod
+    async def _derive_employee_schedule(cls, user, week_delta: int, started: float) -> dict[DayType, ScheduleModel]:
+        """Builds the week of an employee from the subjects stored by the group fetches.
+
+        Returns an empty dict if the employee has no subject there, the upstream call is needed then.
+        """
+        stored = await cls.get_schedule(user, week_delta, with_update=False)
+        days = {day: model for day, model in stored.items() if model and model.subjects.related_objects}
+        if not days:
+            return {}
 
-        await StatsModel.create(action=ActionStats.fetch_data, datetime=datetime.utcnow())
+        # Serialized by snapshot.py like fetched weeks, so the ETag does not change with the source
+        week = ScheduleTime.compute_timestamp(week_delta=week_delta)
+        payload = build_week_document(week, stored)
+        snapshot = ScheduleSnapshotModel(type=user.type, object_id=user.id, week=week,
+                                         payload=payload, etag=CacheService.make_etag(payload))
+        async with in_transaction() as conn:
+            await ScheduleSnapshotModel.bulk_create([snapshot], on_conflict=("type", "object_id", "week"),
+                                                    update_fields=("payload", "etag", "datetime"), using_db=conn)
+            mark = await cls._record(ActionStats.fetch_schedule, user.id, started=started, extra={"derived": True},
+                                     using_db=conn, week=week)
+        cls.freshness.remember(mark)
+        await CacheService.set_etag("schedule", cls.snapshot_key(user, week), snapshot.etag)
+        logger.info("Derived schedule for {} employee from group schedules", user.id)
+        return days
+
+    @classmethod
+    async def _record(
+            cls,
+            action: ActionStats,
+            object_id: typing.Optional[int] = None,
+            started: typing.Optional[float] = None,
+            extra: typing.Optional[dict] = None,
+            using_db=None,
+            week: int = 0
+    ) -> FreshnessMark:
+        """Marks the object (and week of a schedule) as fetched, the stats table is only an optional audit log.
+
+        Inside a transaction the returned mark goes to freshness.remember once it has committed.
+        """
+        mark = await cls.freshness.mark(action, object_id, week, using_db=using_db)
+        if config.STATS_AUDIT_LOG:
+            duration = time.monotonic() - started if started is not None else None
+            await StatsModel.create(action=action, object_id=object_id, datetime=datetime.utcnow(),
+                                    duration=duration, extra=extra or {}, using_db=using_db)
+        return mark
 
     @classmethod
     async def _check_update(cls, action: ActionStats, user = None) -> bool:
@@ -62,18 +370,16 @@ class ScheduleService:
             ActionStats.fetch_faculties: config.UPDATE_FETCH_FACULTIES,
             ActionStats.fetch_departments: config.UPDATE_FETCH_DEPARTMENTS,
             ActionStats.fetch_employees: config.UPDATE_FETCH_EMPLOYEES,
+            ActionStats.fetch_groups: config.UPDATE_FETCH_GROUPS,
             ActionStats.fetch_employee: config.UPDATE_FETCH_EMPLOYEE,
             ActionStats.fetch_data: config.UPDATE_FETCH_DATA
         }
 
-        if user:
-            last_update = await StatsModel.filter(action=action, object_id=user.id).order_by("-datetime").first()
-        else:
-            last_update = await StatsModel.filter(action=action).order_by("-datetime").first()
+        last_update = cls.freshness.get(action, user.id if user else None)
         if not last_update:
             return True
 
-        if last_update.datetime < (datetime.utcnow() - tdict[action]).astimezone(pytz.utc):
+        if last_update < datetime.now(pytz.utc) - tdict[action]:
             return True
 
         return False
@@ -83,18 +389,28 @@ class ScheduleService:
             cls,
             with_save: bool = True
     ) -> list[FacultyModel]:
-        faculties = await cls.http.get_faculties()
+        started = time.monotonic()
+        with cls._track_payloads(with_save):
+            faculties = await cls.http.get_faculties()
+            if faculties is UNCHANGED:
+                await cls._record(ActionStats.fetch_faculties, started=started, extra={"unchanged": True})
+                return await FacultyModel.all()
 
-        faculty_models = [FacultyModel(id=faculty.id,
-                                       title=faculty.title,
-                                       short_title=faculty.short_title) for faculty in faculties]
+            faculty_models = [FacultyModel(id=faculty.id,
+                                           title=faculty.title,
+                                           short_title=faculty.short_title) for faculty in faculties]
 
-        if with_save:
-            await FacultyModel.all().delete()
-            await FacultyModel.bulk_create(faculty_models, ignore_conflicts=True)
-            await StatsModel.create(action=ActionStats.fetch_faculties, datetime=datetime.utcnow())
-
-        logger.info("Fetched faculties")
+            if with_save:
+                async with in_transaction() as conn:
+                    result = await sync_rows(FacultyModel, faculty_models, Q(), ("title", "short_title"), conn)
+                    mark = await cls._record(ActionStats.fetch_faculties, started=started,
+                                             extra=result.to_dict(), using_db=conn)
+                cls.freshness.remember(mark)
+                if result:
+                    await CacheService.invalidate("faculties")
+                logger.info("Fetched faculties {}", result)
+            else:
+                logger.info("Fetched faculties")
 
         return faculty_models
 
@@ -104,18 +420,23 @@ class ScheduleService:
             faculty_id: int,
             with_save: bool = True
     ) -> list[DepartmentModel]:
-        departments = await cls.http.get_departments(faculty_id)
-        department_models = [DepartmentModel(id=department.id,
-                                             title=department.title,
-                                             short_title=department.short_title,
-                                             faculty_id=faculty_id) for department in departments]
+        started = time.monotonic()
+        with cls._track_payloads(with_save):
+            departments = await cls.http.get_departments(faculty_id)
+            if departments is UNCHANGED:
+                await cls._record(ActionStats.fetch_departments, faculty_id, started=started, extra={"unchanged": True})
+                return await DepartmentModel.filter(faculty_id=faculty_id)
+
+            department_models = [DepartmentModel(id=department.id,
+                                                 title=department.title,
+                                                 short_title=department.short_title,
+                                                 faculty_id=faculty_id) for department in departments]
 
-        if with_save:
-            await DepartmentModel.filter(Q(faculty_id=faculty_id)).delete()
-            await DepartmentModel.bulk_create(department_models, ignore_conflicts=True)
-            await StatsModel.create(action=ActionStats.fetch_departments, datetime=datetime.utcnow())
-
-        logger.info("Fetched departments for {} faculty", faculty_id)
+            if with_save:
+                result = await cls.sync_departments({faculty_id: department_models}, started)
+                logger.info("Fetched departments for {} faculty {}", faculty_id, result)
+            else:
+                logger.info("Fetched departments for {} faculty", faculty_id)
 
         return department_models
 
@@ -125,19 +446,25 @@ class ScheduleService:
             department_id: int,
             with_save: bool = True
     ) -> list[EmployeeModel]:
-        employees = await cls.http.get_employees(department_id)
-        employee_models = [EmployeeModel(id=employee.id,
-                                         name=employee.name,
-                                         second_name=employee.second_name,
-                                         middle_name=employee.middle_name,
-                                         department_id=department_id) for employee in employees]
+        started = time.monotonic()
+        with cls._track_payloads(with_save):
+            employees = await cls.http.get_employees(department_id)
+            if employees is UNCHANGED:
+                await cls._record(ActionStats.fetch_employees, department_id, started=started,
+                                  extra={"unchanged": True})
+                return await EmployeeModel.filter(department_id=department_id)
+
+            employee_models = [EmployeeModel(id=employee.id,
+                                             name=employee.name,
+                                             second_name=employee.second_name,
+                                             middle_name=employee.middle_name,
+                                             department_id=department_id) for employee in employees]
 
-        if with_save:
-            await EmployeeModel.filter(Q(department_id=department_id)).delete()
-            await EmployeeModel.bulk_create(employee_models, ignore_conflicts=True)
-            await StatsModel.create(action=ActionStats.fetch_employees, datetime=datetime.utcnow())
-
-        logger.info("Fetched employees for {} department", department_id)
+            if with_save:
+                result = await cls.sync_employees({department_id: employee_models}, started)
+                logger.info("Fetched employees for {} department {}", department_id, result)
+            else:
+                logger.info("Fetched employees for {} department", department_id)
 
         return employee_models
 
@@ -147,27 +474,152 @@ class ScheduleService:
             faculty_id: int,
             with_save: bool = True
     ) -> dict[Years, list[GroupModel]]:
-        group_map: dict[Years, list[GroupModel]] = {}
-        for course in Years:
-            groups = await cls.http.get_groups(faculty_id, course)
-            if not groups:
-                continue
-            group_models = [GroupModel(id=group.id,
-                                       course=course,
-                                       direction=group.direction,
-                                       level=group.level.value,
-                                       name=group.name,
-                                       faculty_id=faculty_id) for group in groups]
-            group_map[course] = group_models
+        started = time.monotonic()
+        with cls._track_payloads(with_save):
+            group_map: dict[Years, list[GroupModel]] = {}
+            changed: list[Years] = []
+            courses = await asyncio.gather(*(cls.http.get_groups(faculty_id, course) for course in Years))
+            for course, groups in zip(Years, courses):
+                if groups is UNCHANGED:
+                    group_map[course] = await GroupModel.filter(Q(faculty_id=faculty_id) & Q(course=course))
+                    continue
+                if not groups:
+                    continue
+                group_models = [GroupModel(id=group.id,
+                                           course=course,
+                                           direction=group.direction,
+                                           level=group.level.value,
+                                           name=group.name,
+                                           faculty_id=faculty_id) for group in groups]
+                group_map[course] = group_models
+                changed.append(course)
+
+            if with_save and changed:
+                result = await cls.sync_groups({faculty_id: group_map}, started)
+                logger.info("Fetched groups for {} faculty {}", faculty_id, result)
+            elif with_save and group_map:
+                await cls._record(ActionStats.fetch_groups, faculty_id, started=started, extra={"unchanged": True})
+                logger.info("Fetched groups for {} faculty, unchanged", faculty_id)
+            else:
+                logger.info("Fetched groups for {} faculty", faculty_id)
 
-            if with_save:
-                await GroupModel.filter(Q(faculty_id=faculty_id) & Q(course=course)).delete()
-                await GroupModel.bulk_create(group_models, ignore_conflicts=True)
-                await StatsModel.create(action=ActionStats.fetch_groups, datetime=datetime.utcnow())
+        return group_map
+
+    @classmethod
+    async def _sync_reference(
+            cls,
+            model: typing.Type[typing.Union[DepartmentModel, EmployeeModel, GroupModel]],
+            action: ActionStats,
+            kind: str,
+            fetched: dict[int, list],
+            scope: Q,
+            fields: typing.Sequence[str],
+            started: float
+    ) -> SyncResult:
+        """Syncs the rows fetched for several parents (faculties or departments) in one transaction.
+
+        A row that moved from one of the parents to another is updated, it is never deleted
+        (cascading to its subjects and exams) and inserted again.
+        """
+        rows = {row.pk: row for models in fetched.values() for row in models}
+        async with in_transaction() as conn:
+            result = await sync_rows(model, list(rows.values()), scope, fields, conn)
+            # Counts are of the whole sync
+            marks = [await cls._record(action, object_id, started=started, extra=result.to_dict(), using_db=conn)
+                     for object_id in fetched]
+        for mark in marks:
+            cls.freshness.remember(mark)
+        if result:
+            for object_id in fetched:
+                await CacheService.invalidate(kind, object_id)
+        return result
 
-        logger.info("Fetched groups for {} faculty", faculty_id)
+    @classmethod
+    async def sync_departments(cls, departments: dict[int, list[DepartmentModel]], started: float) -> SyncResult:
+        """Saves the departments fetched per faculty id"""
+        return await cls._sync_reference(DepartmentModel, ActionStats.fetch_departments, "departments", departments,
+                                         Q(faculty_id__in=list(departments)),
+                                         ("title", "short_title", "faculty_id"), started)
 
-        return group_map
+    @classmethod
+    async def sync_employees(cls, employees: dict[int, list[EmployeeModel]], started: float) -> SyncResult:
+        """Saves the employees fetched per department id"""
+        return await cls._sync_reference(EmployeeModel, ActionStats.fetch_employees, "employees", employees,
+                                         Q(department_id__in=list(employees)),
+                                         ("name", "second_name", "middle_name", "department_id"), started)
+
+    @classmethod
+    async def sync_groups(cls, groups: dict[int, dict[Years, list[GroupModel]]], started: float) -> SyncResult:
+        """Saves the groups fetched per faculty id and course.
+
+        A faculty all courses were fetched for is synced as a whole, so groups moving to the next
+        course are updated in place. Otherwise only the fetched courses are.
+        """
+        scope = functools.reduce(operator.or_, (
+            Q(faculty_id=faculty_id) if set(group_map) == set(Years)
+            else Q(faculty_id=faculty_id) & Q(course__in=list(group_map))
+            for faculty_id, group_map in groups.items()
+        ))
+        return await cls._sync_reference(GroupModel, ActionStats.fetch_groups, "groups",
+                                         {faculty_id: [group for course_groups in group_map.values()
+                                                       for group in course_groups]
+                                          for faculty_id, group_map in groups.items()},
+                                         scope, ("course", "direction", "level", "name", "faculty_id"), started)
+
+    subject_fields = ("name", "sub_group", "audience", "building", "type", "zoom_link", "zoom_password")
+
+    _UPSERT_SCHEDULE_DAYS = (
+        'INSERT INTO "schedule" ("day", "date") '
+        "SELECT * FROM unnest($1::smallint[], $2::int[]) "
+        'ON CONFLICT ("day", "date") DO UPDATE SET "day" = EXCLUDED."day" '
+        'RETURNING "id", "day"'
+    )
+    # A lesson of a group taken over by another employee replaces the row of the previous one
+    _REPLACE_SUBJECTS = (
+        'DELETE FROM "subject" t '
+        'USING unnest($1::int[], $2::int[], $3::smallint[], $4::int[]) '
+        'AS s("schedule_id", "group_id", "number", "employee_id") '
+        'WHERE t."schedule_id" = s."schedule_id" AND t."group_id" = s."group_id" AND t."number" = s."number" '
+        'AND t."employee_id" <> s."employee_id"'
+    )
+
+    @classmethod
+    async def _upsert_schedule_days(cls, days: typing.Iterable[ScheduleDayHTTP], using_db) -> dict[DayType, int]:
+        """Resolves or creates the schedule rows of a week in one statement.
+
+        The no-op DO UPDATE makes RETURNING yield existing rows too, and concurrent fetches
+        of other groups for the same week wait on the row lock instead of failing on the unique key.
+        """
+        days = list(days)
+        _, rows = await using_db.execute_query(cls._UPSERT_SCHEDULE_DAYS,
+                                               [[day.day.value for day in days], [day.date for day in days]])
+        return {DayType(row["day"]): row["id"] for row in rows}
+
+    @staticmethod
+    def _subject_model(subject: ScheduleEntryHTTP, schedule_id: typing.Optional[int] = None) -> ScheduleSubjectModel:
+        s_m = ScheduleSubjectModel(schedule_id=schedule_id,
+                                   **subject.dict(exclude={"employee_name",
+                                                           "employee_second_name",
+                                                           "employee_middle_name"}))
+        s_m.employee = EmployeeModel(id=subject.employee_id,
+                                     name=subject.employee_name,
+                                     second_name=subject.employee_second_name,
+                                     middle_name=subject.employee_middle_name)
+        s_m.employee._fetched = True
+
+        s_m.group = GroupModel(id=subject.group_id,
+                               name=subject.title)
+        s_m.group._fetched = True
+        return s_m
+
+    @staticmethod
+    async def _use_stored_group_names(subjects_by_day: dict[DayType, list[ScheduleSubjectModel]]) -> None:
+        """Names the groups of fetched subjects as the group table does, upstream titles them on its own"""
+        subjects = [s_m for day_subjects in subjects_by_day.values() for s_m in day_subjects]
+        group_ids = list({s_m.group_id for s_m in subjects})
+        names = dict(await GroupModel.filter(id__in=group_ids).values_list("id", "name"))
+        for s_m in subjects:
+            s_m.group.name = names.get(s_m.group_id, s_m.group.name)
 
     @classmethod
     async def fetch_schedule(
@@ -176,92 +628,185 @@ class ScheduleService:
             week_delta: int = 0,
             with_save: bool = True
     ) -> dict[DayType, ScheduleModel]:
-        if user.type == UserType.Student:
-            schedule = await cls.http.get_schedule_student(user.group_id, week_delta=week_delta)
-        else:
-            schedule = await cls.http.get_schedule_employee(user.employee_id, week_delta=week_delta)
-        if not schedule:
-            return {}
-
-        subject_map: dict[DayType, ScheduleModel] = {}
-
-        for schedule_day in schedule.days.values():
-            schedule_m = await ScheduleModel.filter(cls.timestamp_q(week_delta) & Q(day=schedule_day.day)).first()
-
-            if not schedule_m:
-                schedule_m = ScheduleModel(day=schedule_day.day, date=schedule_day.date)
-
-            subjects = [ScheduleSubjectModel(**subject.dict(exclude={"employee_name",
-                                                                     "employee_second_name",
-                                                                     "employee_middle_name"}))
-                        for subject in schedule_day.subjects]
-
-            if with_save:
-                if not schedule_m._saved_in_db:
-                    await schedule_m.save()
-
-                subjects = []
-
-                for subject in schedule_day.subjects:
-                    s_m = ScheduleSubjectModel(schedule_id=schedule_m.id,
-                                               **subject.dict(exclude={"employee_name",
-                                                                       "employee_second_name",
-                                                                       "employee_middle_name"}))
-                    s_m.employee = EmployeeModel(id=subject.employee_id,
-                                                 name=subject.employee_name,
-                                                 second_name=subject.employee_second_name,
-                                                 middle_name=subject.employee_middle_name)
-                    s_m.employee._fetched = True
-
-                    s_m.group = GroupModel(id=subject.group_id,
-                                           name=subject.title)
-                    s_m.group._fetched = True
-
-                    subjects.append(s_m)
-
-                await ScheduleSubjectModel.bulk_create(subjects, on_conflict=("schedule_id", "employee_id", "number"),
-                                                       update_fields=("name",
-                                                                      "sub_group",
-                                                                      "audience",
-                                                                      "building",
-                                                                      "type",
-                                                                      "zoom_link",
-                                                                      "zoom_password"))
-
-            schedule_m.subjects.related_objects = subjects
-            schedule_m.subjects._fetched = True
-
-            subject_map[schedule_day.day] = schedule_m
-
-        if with_save:
-            await StatsModel.create(action=ActionStats.fetch_schedule, object_id=user.id, datetime=datetime.utcnow())
-
-        logger.info("Fetched schedule for {} user", user.id)
+        started = time.monotonic()
+        if (with_save and user.type == UserType.Lecturer
+                and cls._covered_by_groups(ActionStats.ingest_schedules, ScheduleTime.compute_timestamp(week_delta))):
+            derived = await cls._derive_employee_schedule(user, week_delta, started)
+            if derived:
+                return derived
+
+        with cls._track_payloads(with_save):
+            if user.type == UserType.Student:
+                schedule = await cls.http.get_schedule_student(user.group_id, week_delta=week_delta)
+            else:
+                schedule = await cls.http.get_schedule_employee(user.employee_id, week_delta=week_delta)
+            if schedule is UNCHANGED:
+                await cls._record(ActionStats.fetch_schedule, user.id, started=started, extra={"unchanged": True},
+                                  week=ScheduleTime.compute_timestamp(week_delta=week_delta))
+                stored = await cls.get_schedule(user, week_delta=week_delta, with_update=False)
+                return {day: model for day, model in stored.items() if model}
+            if not schedule:
+                return {}
+
+            schedule_ids: dict[DayType, int] = {}
+            subjects_by_day: dict[DayType, list[ScheduleSubjectModel]] = {}
+
+            if with_save and cls.ingest is not None:
+                schedule_ids, subjects_by_day = await cls._buffer_schedule(user, week_delta, schedule, started)
+            elif with_save:
+                async with in_transaction() as conn:
+                    schedule_ids = await cls._upsert_schedule_days(schedule.days.values(), conn)
+
+                    # Keyed by the conflict target, one statement must not upsert the same row twice
+                    subjects: dict[tuple, ScheduleSubjectModel] = {}
+                    for schedule_day in schedule.days.values():
+                        for subject in schedule_day.subjects:
+                            s_m = cls._subject_model(subject, schedule_ids[schedule_day.day])
+                            subjects[(s_m.schedule_id, s_m.employee_id, s_m.number)] = s_m
+                            subjects_by_day.setdefault(schedule_day.day, []).append(s_m)
+
+                    if subjects:
+                        await conn.execute_query(cls._REPLACE_SUBJECTS, [
+                            [s_m.schedule_id for s_m in subjects.values()],
+                            [s_m.group_id for s_m in subjects.values()],
+                            [s_m.number for s_m in subjects.values()],
+                            [s_m.employee_id for s_m in subjects.values()],
+                        ])
+                        await ScheduleSubjectModel.bulk_create(list(subjects.values()),
+                                                               on_conflict=("schedule_id", "employee_id", "number"),
+                                                               update_fields=cls.subject_fields,
+                                                               using_db=conn)
+
+                    week = ScheduleTime.compute_timestamp(week_delta=week_delta)
+                    await cls._use_stored_group_names(subjects_by_day)
+                    payload = build_week_snapshot(week, subjects_by_day)
+                    snapshot = ScheduleSnapshotModel(type=user.type, object_id=user.id, week=week,
+                                                     payload=payload, etag=CacheService.make_etag(payload))
+                    await ScheduleSnapshotModel.bulk_create([snapshot], on_conflict=("type", "object_id", "week"),
+                                                            update_fields=("payload", "etag", "datetime"),
+                                                            using_db=conn)
+                    mark = await cls._record(ActionStats.fetch_schedule, user.id, started=started, using_db=conn,
+                                             week=week)
+                cls.freshness.remember(mark)
+                await CacheService.set_etag("schedule", cls.snapshot_key(user, week), snapshot.etag)
+            else:
+                for schedule_day in schedule.days.values():
+                    subjects_by_day[schedule_day.day] = [cls._subject_model(subject)
+                                                         for subject in schedule_day.subjects]
+
+            subject_map: dict[DayType, ScheduleModel] = {}
+            for schedule_day in schedule.days.values():
+                schedule_m = ScheduleModel(id=schedule_ids.get(schedule_day.day),
+                                           day=schedule_day.day,
+                                           date=schedule_day.date)
+                schedule_m._saved_in_db = schedule_day.day in schedule_ids
+                schedule_m.subjects.related_objects = subjects_by_day.get(schedule_day.day, [])
+                schedule_m.subjects._fetched = True
+                subject_map[schedule_day.day] = schedule_m
+
+            logger.info("Fetched schedule for {} user", user.id)
 
         return subject_map
 
     @classmethod
-    async def fetch_exams(cls, user, with_save: bool = True) -> list[ExamModel]:
-        if user.type == UserType.Student:
-            schedule = await cls.http.get_exams_student(user.group_id)
-            user_q = Q(group_id=user.group_id)
-        else:
-            schedule = await cls.http.get_exams_employee(user.employee_id)
-            user_q = Q(employee_id=user.employee_id)
-        if not schedule:
-            return []
+    async def _resolve_schedule_days(cls, days: list[ScheduleDayHTTP]) -> dict[DayType, int]:
+        if any((day.day, day.date) not in cls.schedule_ids for day in days):
+            resolved = await cls._upsert_schedule_days(days, ScheduleModel._meta.db)
+            cls.schedule_ids.update({(day.day, day.date): resolved[day.day] for day in days})
+        return {day.day: cls.schedule_ids[(day.day, day.date)] for day in days}
 
-        subjects = [ExamModel(**exam.dict(exclude={"employee_name",
-                                                   "employee_second_name",
-                                                   "employee_middle_name"}))
-                    for exam in schedule]
+    @classmethod
+    async def _buffer_schedule(
+            cls,
+            user,
+            week_delta: int,
+            schedule,
+            started: float
+    ) -> tuple[dict[DayType, int], dict[DayType, list[ScheduleSubjectModel]]]:
+        """Writes a fetched week through the COPY buffers, merged together with the weeks of other fetches"""
+        schedule_ids = await cls._resolve_schedule_days(list(schedule.days.values()))
+
+        subjects_by_day: dict[DayType, list[ScheduleSubjectModel]] = {}
+        rows = []
+        for schedule_day in schedule.days.values():
+            for subject in schedule_day.subjects:
+                s_m = cls._subject_model(subject, schedule_ids[schedule_day.day])
+                subjects_by_day.setdefault(schedule_day.day, []).append(s_m)
+                rows.append((s_m.schedule_id, s_m.employee_id, s_m.number, s_m.group_id, s_m.name, s_m.sub_group,
+                             s_m.audience, s_m.building, s_m.type, s_m.zoom_link, s_m.zoom_password))
+
+        week = ScheduleTime.compute_timestamp(week_delta=week_delta)
+        await cls._use_stored_group_names(subjects_by_day)
+        payload = build_week_snapshot(week, subjects_by_day)
+        etag = CacheService.make_etag(payload)
+        # The snapshot is only written once the subjects it describes are
+        await cls.ingest.subjects.add(rows)
+        await cls.ingest.snapshots.add([(user.type, user.id, week, payload, etag, datetime.now(pytz.utc))])
+        await cls._record(ActionStats.fetch_schedule, user.id, started=started, week=week)
+        await CacheService.set_etag("schedule", cls.snapshot_key(user, week), etag)
+        return schedule_ids, subjects_by_day
+
+    exam_fields = ("day", "name", "dislocation", "type", "time", "zoom_link", "zoom_password")
+
+    @staticmethod
+    def _exam_key(exam: ExamModel) -> tuple:
+        return exam.date, exam.number, exam.sub_group, exam.group_id, exam.employee_id
 
-        if with_save:
-            await ExamModel.filter(user_q).delete()
-            await ExamModel.bulk_create(subjects, ignore_conflicts=True)
-            await StatsModel.create(action=ActionStats.fetch_exams, object_id=user.id, datetime=datetime.utcnow())
+    @classmethod
+    async def fetch_exams(cls, user, with_save: bool = True) -> list[ExamModel]:
+        started = time.monotonic()
+        if with_save and user.type == UserType.Lecturer and cls._covered_by_groups(ActionStats.ingest_exams):
+            # The exams of the employee are already stored with the groups they are held for
+            exams = await cls.get_exams(user, with_update=False)
+            if exams:
+                await cls._record(ActionStats.fetch_exams, user.id, started=started, extra={"derived": True})
+                return exams
+
+        with cls._track_payloads(with_save):
+            if user.type == UserType.Student:
+                schedule = await cls.http.get_exams_student(user.group_id)
+                user_q = Q(group_id=user.group_id)
+            else:
+                schedule = await cls.http.get_exams_employee(user.employee_id)
+                user_q = Q(employee_id=user.employee_id)
+            if schedule is UNCHANGED:
+                await cls._record(ActionStats.fetch_exams, user.id, started=started, extra={"unchanged": True})
+                return await cls.get_exams(user, with_update=False)
+            if not schedule:
+                return []
+
+            subjects = [ExamModel(**exam.dict(exclude={"id",
+                                                       "employee_name",
+                                                       "employee_second_name",
+                                                       "employee_middle_name"}))
+                        for exam in schedule]
 
-        logger.info("Fetched exams {} for user", user.id)
+            if with_save:
+                # Exams that are gone change the documents of their other owner too
+                counterpart = "employee_id" if user.type == UserType.Student else "group_id"
+                counterparts = set(await ExamModel.filter(user_q).distinct().values_list(counterpart, flat=True))
+                counterparts.update(getattr(e_m, counterpart) for e_m in subjects)
+
+            if with_save and cls.ingest is not None:
+                buffer = cls.ingest.group_exams if user.type == UserType.Student else cls.ingest.employee_exams
+                # Counts are of the whole merged batch
+                result = await buffer.add([(e_m.date, e_m.number, e_m.sub_group, e_m.group_id, e_m.employee_id,
+                                            e_m.day, e_m.name, e_m.dislocation, e_m.type, e_m.time,
+                                            e_m.zoom_link, e_m.zoom_password) for e_m in subjects], scope=[user.id])
+                await cls._record(ActionStats.fetch_exams, user.id, started=started, extra=result.to_dict())
+                await cls._forget_exams_etags(user, counterparts)
+                logger.info("Fetched exams for {} user {}", user.id, result)
+            elif with_save:
+                async with in_transaction() as conn:
+                    result = await sync_rows(ExamModel, subjects, user_q, cls.exam_fields, conn, key=cls._exam_key)
+                    mark = await cls._record(ActionStats.fetch_exams, user.id, started=started,
+                                             extra=result.to_dict(), using_db=conn)
+                cls.freshness.remember(mark)
+                if result:
+                    await cls._forget_exams_etags(user, counterparts)
+                logger.info("Fetched exams for {} user {}", user.id, result)
+            else:
+                logger.info("Fetched exams for {} user", user.id)
 
         return subjects
 
@@ -284,36 +829,178 @@ class ScheduleService:
             week_delta: int = 0,
             with_update: bool = True
     ) -> dict[DayType, ScheduleModel]:
-        # if with_update and await cls._check_update(action=ActionStats.fetch_schedule, user=user):
-        #     return await cls.fetch_schedule(user, week_delta=week_delta)
-        # await fetch_schedule_ratelimiter.acquire(user)
-        # if with_update and not fetch_schedule_ratelimiter.is_rate_limited(user):
-        #     return await cls.fetch_schedule(user, week_delta=week_delta)
-
-        user_q = Q(group_id=user.group_id) if user.type == UserType.Student else Q(employee_id=user.employee_id)
-        models = (await ScheduleModel
-                  .filter(cls.timestamp_q(week_delta))
-                  .prefetch_related(Prefetch("subjects", queryset=ScheduleSubjectModel.filter(user_q)
-                                             .prefetch_related("group", "employee"))))
+        if with_update:
+            cls.scheduler.touch(user, ActionStats.fetch_schedule, week_delta)
 
         subject_map: dict[DayType, ScheduleModel] = {day: None for day in DayType}
-        ...
-        for model in models:
-            subject_map[model.day] = model
+        for day, rows in (await cls.get_schedule_rows(user, week_delta)).items():
+            schedule_m = ScheduleModel(id=rows[0]["schedule_id"], day=day, date=rows[0]["date"])
+            schedule_m._saved_in_db = True
+            schedule_m.subjects.related_objects = [cls._subject_from_row(row) for row in rows if row["id"] is not None]
+            schedule_m.subjects._fetched = True
+            subject_map[day] = schedule_m
 
         return subject_map
 
+    @classmethod
+    async def get_schedule_rows(cls, user, week_delta: int = 0) -> dict[DayType, list[typing.Mapping]]:
+        """Reads a week of one owner with a single joined query, rows bucketed by day"""
+        start, end = cls.week_bounds(week_delta)
+        _, rows = await ScheduleModel._meta.db.execute_query(WEEK_ROWS.format(owner=owner_column(user.type)),
+                                                             [user.id, start, end])
+        days: dict[DayType, list[typing.Mapping]] = {}
+        for row in rows:
+            days.setdefault(DayType(row["day"]), []).append(row)
+        return days
+
+    @staticmethod
+    def _subject_from_row(row: typing.Mapping) -> ScheduleSubjectModel:
+        s_m = ScheduleSubjectModel(id=row["id"],
+                                   name=row["name"],
+                                   sub_group=row["sub_group"],
+                                   audience=row["audience"],
+                                   building=row["building"],
+                                   number=row["number"],
+                                   type=SubjectType(row["type"]),
+                                   zoom_link=row["zoom_link"],
+                                   zoom_password=row["zoom_password"],
+                                   schedule_id=row["schedule_id"],
+                                   group_id=row["group_id"],
+                                   employee_id=row["employee_id"])
+        s_m._saved_in_db = True
+        s_m.group = GroupModel(id=row["group_id"],
+                               name=row["group_name"],
+                               direction=row["group_direction"],
+                               course=Years(row["group_course"]),
+                               level=EducationalLevel(row["group_level"]),
+                               faculty_id=row["group_faculty_id"])
+        s_m.group._saved_in_db = True
+        s_m.employee = EmployeeModel(id=row["employee_id"],
+                                     name=row["employee_name"],
+                                     second_name=row["employee_second_name"],
+                                     middle_name=row["employee_middle_name"],
+                                     department_id=row["employee_department_id"])
+        s_m.employee._saved_in_db = True
+        return s_m
+
+    @staticmethod
+    def snapshot_key(user, week: int) -> str:
+        return f"{user.type.value}:{user.id}:{week}"
+
+    @staticmethod
+    def owner_key(user) -> str:
+        return f"{user.type.value}:{user.id}"
+
+    @classmethod
+    async def get_schedule_etag(cls, user, week_delta: int = 0) -> typing.Optional[str]:
+        """Returns the ETag of a week snapshot, every read starts here.
+
+        A process-local cache misses the snapshots other workers wrote, the ETag is then read
+        from the snapshot row (a unique index lookup) instead.
+        """
+        cls.scheduler.touch(user, ActionStats.fetch_schedule, week_delta)
+        week = ScheduleTime.compute_timestamp(week_delta=week_delta)
+        if CacheService.shared:
+            return await CacheService.get_etag("schedule", cls.snapshot_key(user, week))
+        row = await ScheduleSnapshotModel.filter(type=user.type, object_id=user.id, week=week).first() \
+            .values_list("etag")
+        return row[0] if row is not None else None
+
+    @classmethod
+    async def get_schedule_snapshot(cls, user, week_delta: int = 0) -> typing.Optional[tuple[str, bytes]]:
+        """Returns the ETag and the ready to send JSON of a week, fetching it once if there is no snapshot yet"""
+        week = ScheduleTime.compute_timestamp(week_delta=week_delta)
+        query = ScheduleSnapshotModel.filter(type=user.type, object_id=user.id, week=week)
+        row = await query.first().values_list("etag", "payload")
+        if row is None:
+            fetched = await cls.fetch_schedule(user, week_delta=week_delta)
+            row = await query.first().values_list("etag", "payload")
+            if row is None and fetched:
+                # Upstream answered UNCHANGED for a week stored without a snapshot
+                row = await cls._snapshot_stored_week(user, week_delta)
+        if row is None:
+            return None
+
+        etag, payload = row
+        await CacheService.set_etag("schedule", cls.snapshot_key(user, week), etag)
+        return etag, payload
+
+    @classmethod
+    async def _snapshot_stored_week(cls, user, week_delta: int) -> tuple[str, bytes]:
+        """Builds the snapshot of a week from its stored rows with WEEK_DOCUMENT, later reads are served from it"""
+        start, end = cls.week_bounds(week_delta)
+        payload = await cls._document(WEEK_DOCUMENT.format(owner=owner_column(user.type)), [user.id, start, end])
+        snapshot = ScheduleSnapshotModel(type=user.type, object_id=user.id, week=start,
+                                         payload=payload, etag=CacheService.make_etag(payload))
+        await ScheduleSnapshotModel.bulk_create([snapshot], on_conflict=("type", "object_id", "week"),
+                                                update_fields=("payload", "etag", "datetime"))
+        return snapshot.etag, payload
+
+    @classmethod
+    async def _document(cls, sql: str, params: list) -> bytes:
+        """Runs a *_DOCUMENT query, its JSON comes from the driver as bytes ready to send"""
+        _, rows = await ScheduleModel._meta.db.execute_query(sql, params)
+        return rows[0][0]
+
+    @classmethod
+    async def iter_schedule_documents(
+            cls,
+            user_type: UserType,
+            object_ids: typing.Sequence[int],
+            week_delta: int = 0
+    ) -> typing.AsyncIterator[tuple[int, bytes]]:
+        """Yields (id, week JSON) of many groups or employees, read with one query through a cursor"""
+        for object_id in object_ids:
+            cls.scheduler.touch(ScheduleUser(user_type, object_id), ActionStats.fetch_schedule, week_delta)
+
+        start, end = cls.week_bounds(week_delta)
+        sql = BATCH_WEEK_DOCUMENTS.format(owner=owner_column(user_type))
+        async with ScheduleModel._meta.db.acquire_connection() as connection, connection.transaction():
+            async for object_id, document in connection.cursor(sql, list(object_ids), start, end):
+                yield object_id, document
+
+    @classmethod
+    async def get_exams_etag(cls, user) -> typing.Optional[str]:
+        """Returns the ETag of the exams last served without touching the database, every read starts here.
+
+        Exams ETags are only kept in a shared cache, other workers would not forget them on changes.
+        """
+        cls.scheduler.touch(user, ActionStats.fetch_exams)
+        if not CacheService.shared:
+            return None
+        return await CacheService.get_etag("exams", cls.owner_key(user))
+
+    @classmethod
+    async def get_exams_document(cls, user) -> tuple[str, bytes]:
+        """Returns the ETag and the JSON of the exams, assembled by Postgres if DB_JSON_READS is set.
+
+        The ETag is kept until fetch_exams changes the exams, conditional requests are answered from it.
+        """
+        if config.DB_JSON_READS:
+            body = await cls._document(EXAMS_DOCUMENT.format(owner=owner_column(user.type)), [user.id])
+        else:
+            body = build_exams_document(await cls.get_exams(user, with_update=False))
+        etag = CacheService.make_etag(body)
+        if CacheService.shared:
+            await CacheService.set_etag("exams", cls.owner_key(user), etag)
+        return etag, body
+
+    @classmethod
+    async def _forget_exams_etags(cls, user, counterparts: typing.Iterable[int]) -> None:
+        """Drops the exams ETags of the user and of the groups or employees its exams are shared with"""
+        other = UserType.Lecturer if user.type == UserType.Student else UserType.Student
+        owners = {user, *(ScheduleUser(other, object_id) for object_id in counterparts if object_id is not None)}
+        for owner in owners:
+            await CacheService.forget_etag("exams", cls.owner_key(owner))
+
     @classmethod
     async def get_exams(
             cls,
             user,
             with_update: bool = True,
     ) -> list[ExamModel]:
-        # if with_update and await cls._check_update(action=ActionStats.fetch_exams, user=user):
-        #     return await cls.fetch_exams(user)
-
-        # if with_update and not fetch_exams_ratelimiter.is_rate_limited(user):
-        #     return await cls.fetch_exams(user)
+        if with_update:
+            cls.scheduler.touch(user, ActionStats.fetch_exams)
 
         user_q = Q(group_id=user.group_id) if user.type == UserType.Student else Q(employee_id=user.employee_id)
         return await ExamModel.filter(user_q).prefetch_related("employee", "group")
@@ -1,30 +1,34 @@
+import asyncio
 import time
 import typing
 import typing as t
-from datetime import datetime, timedelta
+from datetime import datetime
 
 import httpx
 import orjson
 import pytz
 
 from urllib.parse import quote
-from fake_useragent import UserAgent
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
 from loguru import logger
 
 import config
+from app.utils.ratelimiter import RateLimiter, BucketType, MemoryBackend, PostgresBackend
+from app.utils.singleflight import SingleFlight
 from app.utils.time import ScheduleTime
 from app.models.enums import Years
-from app.models.db import UserAgentModel, CookieModel
+from app.models.db import UserAgentModel, CookieModel, CookieRequestModel
 
+from .fingerprint import UNCHANGED, FingerprintStore
 from .models import (ScheduleEntryHTTP,
                      StudentGroupHTTP,
                      FacultyHTTP,
                      DepartmentHTTP,
                      EmployeeHTTP, ScheduleHTTP,
                      ExamHTTP)
+from .decode import ScheduleEntryRecord, ExamRecord
+
+ScheduleEntry = ScheduleEntryRecord if config.FAST_DECODE else ScheduleEntryHTTP
+Exam = ExamRecord if config.FAST_DECODE else ExamHTTP
 
 
 async def json_or_text(response: httpx.Response) -> dict | str | None:
@@ -39,6 +43,40 @@ async def json_or_text(response: httpx.Response) -> dict | str | None:
     return text
 
 
+def _acquire_cookies() -> tuple[str, str]:
+    """Opens the site in Chrome and returns the user agent and cookie header it got. Blocking."""
+    # The scraping stack is heavy to import and only needed here
+    from fake_useragent import UserAgent
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.common.by import By
+
+    user_agent = UserAgent().chrome
+
+    chrome_options = webdriver.ChromeOptions()
+    chrome_options.add_argument(f'user-agent={user_agent}')
+    chrome_options.add_argument("--start-maximized")  # open Browser in maximized mode
+    chrome_options.add_argument("--no-sandbox")  # bypass OS security model
+    chrome_options.add_argument("--disable-dev-shm-usage")  # overcome limited resource problems
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    chrome_options.add_experimental_option('useAutomationExtension', False)
+
+    s = Service(executable_path=config.api.chrome_driver_dir)
+    driver = webdriver.Chrome(service=s, options=chrome_options)
+    try:
+        logger.info("Fetching cookies for user-agent {}", user_agent)
+        driver.get(Route.BASE)
+        time.sleep(5)
+        cookie_btn = driver.find_element(By.XPATH, '/html/body/div[6]/div/div/div/div')
+        cookie_btn.click()
+        cookies = driver.get_cookies()
+        logger.info("Fetched cookies {}", cookies)
+        return user_agent, " ".join(f'{cookie.get("name")}={cookie.get("value")};' for cookie in cookies)
+    finally:
+        driver.close()
+        driver.quit()
+
+
 class Route:
     BASE: t.ClassVar[str] = 'https://oreluniver.ru'
 
@@ -54,7 +92,20 @@ class Route:
 class HTTPClient:
     """Represents an HTTP client sending HTTP requests to the oreluniver.ru"""
 
-    __slots__ = ("_client", "_client_kwargs", "user_agent", "cookie")
+    __slots__ = ("_client",
+                 "_client_kwargs",
+                 "_semaphore",
+                 "_cookie_task",
+                 "_cookie_refresher",
+                 "_cookie_fetched_at",
+                 "_cookie_generation",
+                 "_cookie_requested",
+                 "cookie_owner",
+                 "fingerprints",
+                 "flights",
+                 "ratelimiter",
+                 "user_agent",
+                 "cookie")
 
     def __init__(self):
         limits = httpx.Limits(
@@ -68,8 +119,26 @@ class HTTPClient:
         )
 
         self._client = self._build_client()
+        # Never queue more requests on the pool than it can serve, otherwise fan-out hits PoolTimeout
+        self._semaphore = asyncio.Semaphore(limits.max_connections)
+        self.fingerprints = FingerprintStore()
+        self.flights = SingleFlight()
+        self.ratelimiter = RateLimiter(config.UPSTREAM_RATE_PERIOD, config.UPSTREAM_RATE_LIMIT, BucketType.GLOBAL,
+                                       backend=PostgresBackend("upstream")
+                                       if config.RATE_LIMIT_BACKEND == "postgres" else MemoryBackend())
         self.user_agent: t.Optional[str] = ""
         self.cookie: t.Optional[str] = ""
+        self._cookie_task: t.Optional[asyncio.Task[bool]] = None
+        self._cookie_refresher: t.Optional[asyncio.Task[None]] = None
+        self._cookie_fetched_at: t.Optional[datetime] = None
+        self._cookie_generation: int = 0
+        self._cookie_requested: t.Optional[str] = None
+        # Only the owner drives Chrome, the other workers pick up the cookies it saves
+        self.cookie_owner: bool = False
+
+    @property
+    def max_connections(self) -> int:
+        return self._client_kwargs["limits"].max_connections
 
     def _build_client(self) -> httpx.AsyncClient:
         return httpx.AsyncClient(**self._client_kwargs)  # type: ignore[arg-type]
@@ -78,7 +147,20 @@ class HTTPClient:
         if self._client.is_closed:
             self._client = self._build_client()
 
+        await self.load_cookies()
+
+    def set_cookie_owner(self, owner: bool) -> None:
+        """Starts or stops keeping cookies fresh for the whole deployment"""
+        self.cookie_owner = owner
+        if owner and self._cookie_refresher is None:
+            self._cookie_refresher = asyncio.create_task(self._keep_cookies_fresh())
+        elif not owner and self._cookie_refresher is not None:
+            self._cookie_refresher.cancel()
+            self._cookie_refresher = None
+
     async def shutdown(self) -> None:
+        self.set_cookie_owner(False)
+
         if self._client.is_closed:
             logger.debug("This HTTPXRequest is already shut down. Returning.")
             return
@@ -86,67 +168,130 @@ class HTTPClient:
         await self._client.aclose()
 
     async def request(self, route: Route) -> t.Any:
-        url = route.url
-        method = route.method
-
         if self._client.is_closed:
             raise RuntimeError("This HTTPXRequest is not initialized!")
 
+        # Tracked callers may get UNCHANGED instead of the payload, so they never share a call with the others
+        key = (route.method, route.url, self.fingerprints.tracking)
+        return await self.flights.do(key, lambda: self._request(route))
+
+    async def _request(self, route: Route) -> t.Any:
+        url = route.url
+        method = route.method
+
         for tries in range(5):
+            generation = self._cookie_generation
+            await self.ratelimiter.acquire(None)
             try:
-                response = await self._client.request(
-                    method=method,
-                    url=url,
-                    headers={"User-Agent": self.user_agent, "cookie": self.cookie},
-                )
+                async with self._semaphore:
+                    response = await self._client.request(
+                        method=method,
+                        url=url,
+                        headers={"User-Agent": self.user_agent, "cookie": self.cookie},
+                    )
             except httpx.TimeoutException as err:
                 raise err
             except httpx.HTTPError as err:
                 raise err
 
+            if (response.headers.get('content-type') == 'application/json'
+                    and self.fingerprints.check(url, response.content)):
+                return UNCHANGED
+
             data = await json_or_text(response)
             logger.error(response.text)
 
             if data is not None:
                 return data
 
-            await self.update_cookies()
+            # Someone else already refreshed cookies while this request was in flight
+            if generation == self._cookie_generation:
+                await self.update_cookies()
+
+        # Callers must not mistake the failure for an empty answer, the job queue retries it
+        raise RuntimeError(f"{method} {url} returned no data after 5 attempts")
 
-    async def update_cookies(self):
+    async def load_cookies(self) -> None:
+        """Restores the latest cookie and user agent saved by a previous run"""
+        cookie = await CookieModel.filter().order_by("-datetime").first()
         user_agent = await UserAgentModel.filter().order_by("-datetime").first()
-        if user_agent and user_agent.datetime > (datetime.utcnow() - timedelta(minutes=1)).astimezone(pytz.utc):
-            pass
-
-        chrome_options = webdriver.ChromeOptions()
-        ua = UserAgent()
-        chrome_options.add_argument(f'user-agent={self.user_agent}')
-        self.user_agent = ua.chrome
-        chrome_options.add_argument("--start-maximized")  # open Browser in maximized mode
-        chrome_options.add_argument("--no-sandbox")  # bypass OS security model
-        chrome_options.add_argument("--disable-dev-shm-usage")  # overcome limited resource problems
-        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        chrome_options.add_experimental_option('useAutomationExtension', False)
-
-        s = Service(executable_path=config.api.chrome_driver_dir)
-        driver = webdriver.Chrome(service=s, options=chrome_options)
-        try:
-            logger.info("Fetching cookies for user-agent {}", self.user_agent)
-            driver.get(Route.BASE)
-            time.sleep(5)
-            cookie_btn = driver.find_element(By.XPATH, '/html/body/div[6]/div/div/div/div')
-            cookie_btn.click()
-            cookies = driver.get_cookies()
-            logger.info("Fetched cookies {}", cookies)
-            self.cookie = " ".join(f'{cookie.get("name")}={cookie.get("value")};' for cookie in cookies)
-
-            await UserAgentModel.create(extra=self.user_agent, datetime=datetime.utcnow())
-            await CookieModel.create(extra=self.cookie, datetime=datetime.utcnow())
+        if not cookie or not user_agent:
+            return
+
+        self.cookie = cookie.extra
+        self.user_agent = user_agent.extra
+        self._cookie_fetched_at = cookie.datetime
+        logger.info("Loaded cookies from {}", cookie.datetime)
+
+    async def update_cookies(self) -> bool:
+        """Refreshes cookies, concurrent callers wait for the same refresh"""
+        if self._cookie_task is None or self._cookie_task.done():
+            self._cookie_task = asyncio.create_task(self._refresh_cookies())
+        return await asyncio.shield(self._cookie_task)
+
+    async def _reload_cookies(self) -> bool:
+        """Picks up cookies saved by the owner, True if they are newer than the current ones"""
+        fetched_at = self._cookie_fetched_at
+        await self.load_cookies()
+        if self._cookie_fetched_at == fetched_at:
+            return False
+        self._cookie_generation += 1
+        return True
+
+    async def _request_refresh(self) -> None:
+        """Asks the owner for new cookies, once per rejected cookie"""
+        if self._cookie_requested == self.cookie:
+            return
+        self._cookie_requested = self.cookie
+        await CookieRequestModel.create(cookie=self.cookie)
+        logger.info("Asked the cookie owner for new cookies")
 
+    async def _refresh_requested(self) -> bool:
+        """Whether another worker found the current cookies rejected"""
+        try:
+            return await CookieRequestModel.filter(cookie=self.cookie).exists()
+        except Exception as ex:
+            logger.error("Failed to check cookie refresh requests: {}", ex)
+            return False
+
+    async def _refresh_cookies(self) -> bool:
+        if not self.cookie_owner:
+            if await self._reload_cookies():
+                return True
+            await self._request_refresh()
+            return False
+        try:
+            # Chrome is blocking, keep it away from the event loop
+            user_agent, cookie = await asyncio.to_thread(_acquire_cookies)
         except Exception as ex:
-            logger.error(ex)
-        finally:
-            driver.close()
-            driver.quit()
+            logger.error("Failed to fetch cookies: {}", ex)
+            return False
+
+        self.user_agent = user_agent
+        self.cookie = cookie
+        self._cookie_fetched_at = datetime.now(pytz.utc)
+        self._cookie_generation += 1
+
+        await UserAgentModel.create(extra=self.user_agent, datetime=datetime.utcnow())
+        await CookieModel.create(extra=self.cookie, datetime=datetime.utcnow())
+        # Requests left are about older cookies
+        await CookieRequestModel.exclude(cookie=self.cookie).delete()
+        return True
+
+    async def _keep_cookies_fresh(self) -> None:
+        while True:
+            if self._cookie_fetched_at is None:
+                delay = 0.0
+            else:
+                expires_at = self._cookie_fetched_at + config.COOKIE_TTL - config.COOKIE_REFRESH_BEFORE
+                delay = (expires_at - datetime.now(pytz.utc)).total_seconds()
+
+            if delay > 0 and not await self._refresh_requested():
+                await asyncio.sleep(min(delay, config.COOKIE_REQUEST_POLL.total_seconds()))
+                continue
+
+            if not await self.update_cookies():
+                await asyncio.sleep(config.COOKIE_RETRY_DELAY.total_seconds())
 
     async def get_schedule_student(self, group_id: int, week_delta: int = 0) -> t.Optional[ScheduleHTTP]:
         timestamp = ScheduleTime.compute_timestamp_for_api(week_delta)
@@ -154,10 +299,12 @@ class HTTPClient:
                       group_id=group_id,
                       timestamp=timestamp)
         data: dict = await self.request(route)
+        if data is UNCHANGED:
+            return UNCHANGED
         if not data:
             return
         schedule = ScheduleHTTP(ScheduleTime.compute_timestamp(week_delta=week_delta),
-                                sorted([ScheduleEntryHTTP.parse_obj(raw) for index, raw in data.items()
+                                sorted([ScheduleEntry.parse_obj(raw) for index, raw in data.items()
                                         if index.isdigit()],
                                        key=lambda x: x.date))
         return schedule
@@ -168,47 +315,63 @@ class HTTPClient:
                       employee_id=employee_id,
                       timestamp=timestamp)
         data: dict = await self.request(route)
+        if data is UNCHANGED:
+            return UNCHANGED
         if not data:
             return
         return ScheduleHTTP(ScheduleTime.compute_timestamp(week_delta=week_delta),
-                            sorted([ScheduleEntryHTTP.parse_obj(raw) for index, raw in data.items()
+                            sorted([ScheduleEntry.parse_obj(raw) for index, raw in data.items()
                                     if index.isdigit()],
                                    key=lambda x: x.date))
 
     async def get_groups(self, faculty_id: int, course: Years) -> t.List[StudentGroupHTTP]:
         route = Route('GET', '/schedule/{faculty_id}/{course}/grouplist', faculty_id=faculty_id, course=course.value)
         data: dict = await self.request(route)
+        if data is UNCHANGED:
+            return UNCHANGED
         return [StudentGroupHTTP.parse_obj(raw) for raw in data]
 
     async def get_faculties(self) -> t.List[FacultyHTTP]:
         route = Route('GET', '/schedule/divisionlistforstuds')
         data = await self.request(route)
+        if data is UNCHANGED:
+            return UNCHANGED
         return [FacultyHTTP.parse_obj(raw) for raw in data]
 
     async def get_departments(self, faculty_id: int) -> t.List[DepartmentHTTP]:
         route = Route('GET', '/schedule/{faculty_id}/kaflist', faculty_id=faculty_id)
         data: dict = await self.request(route)
+        if data is UNCHANGED:
+            return UNCHANGED
         return [DepartmentHTTP.parse_obj(raw) for raw in data]
 
     async def get_employees(self, department_id: int) -> t.List[EmployeeHTTP]:
         route = Route('GET', '/schedule/{department_id}/preplist',
                       department_id=department_id)
         data: dict = await self.request(route)
+        if data is UNCHANGED:
+            return UNCHANGED
         return [EmployeeHTTP.parse_obj(raw) for raw in data]
 
     async def get_employee(self, employee_id: int) -> EmployeeHTTP:
         route = Route('GET', '/employee/{employee_id}', employee_id=employee_id)
         data: dict = await self.request(route)
+        if data is UNCHANGED:
+            return UNCHANGED
         return EmployeeHTTP.parse_obj(data)
 
     async def get_exams_student(self, group_id: int) -> typing.List[ExamHTTP]:
         route = Route('GET', '/schedule/{group_id}////printexamschedule', group_id=group_id)
         data: dict = await self.request(route)
-        return sorted([ExamHTTP.parse_obj(raw) for raw in data],
+        if data is UNCHANGED:
+            return UNCHANGED
+        return sorted([Exam.parse_obj(raw) for raw in data],
                       key=lambda x: x.time)
 
     async def get_exams_employee(self, employee_id: int) -> typing.List[ExamHTTP]:
         route = Route('GET', '/schedule//{employee_id}///printexamschedule', employee_id=employee_id)
         data: dict = await self.request(route)
-        return sorted([ExamHTTP.parse_obj(raw) for raw in data],
+        if data is UNCHANGED:
+            return UNCHANGED
+        return sorted([Exam.parse_obj(raw) for raw in data],
                       key=lambda x: x.time)
@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+import asyncio
+import time
+import typing as t
+
+from loguru import logger
+from tortoise import Tortoise
+
+from .ingest import SyncResult
+
+__all__: t.Sequence[str] = ("CopyBuffer", "IngestPipeline")
+
+
+def _count(status: str) -> int:
+    """Row count of a command status such as ``UPDATE 5`` or ``INSERT 0 5``"""
+    return int(status.rsplit(" ", 1)[-1])
+
+
+class _Batch:
+    __slots__ = ("rows", "scope", "done", "opened_at")
+
+    def __init__(self) -> None:
+        self.rows: dict[tuple, tuple] = {}
+        self.scope: set[int] = set()
+        self.done: asyncio.Future[SyncResult] = asyncio.get_running_loop().create_future()
+        self.opened_at: float = time.monotonic()
+
+
+class CopyBuffer:
+    """Collects rows of one table from concurrent writers and merges them in batches.
+
+    A batch is sent with binary COPY into a temporary staging table and merged: rows holding a
+    ``replace`` key of a staged row under another ``key`` are deleted, the ``update`` columns
+    (every non-key column by default) of changed rows are updated, new rows inserted and, if
+    ``scope`` is set, rows of the scoped owners missing from the batch deleted. New rows still
+    conflicting with a unique key are skipped and counted in ``conflicts``. A batch is flushed
+    once it holds ``max_rows`` rows or ``max_delay`` seconds after its first row. :meth:`add`
+    returns once its rows are committed and waits while ``max_pending`` rows are already waiting
+    for a flush.
+
+    Rows are tuples in ``columns`` order and are matched on the ``key`` columns; the last row
+    added for a key wins, as it would with one upsert per writer. ``key`` must be a unique key of
+    the table, concurrent merges of the same rows then insert them once.
+    """
+
+    def __init__(
+            self,
+            table: str,
+            columns: t.Sequence[str],
+            key: t.Sequence[str],
+            scope: t.Optional[str] = None,
+            replace: t.Sequence[t.Sequence[str]] = (),
+            update: t.Optional[t.Sequence[str]] = None,
+            max_rows: int = 5000,
+            max_delay: float = 0.05,
+            max_pending: int = 50000,
+    ) -> None:
+        self.table = table
+        self.columns = tuple(columns)
+        self.key = tuple(key)
+        self.scope = scope
+        self.replace = tuple(tuple(columns) for columns in replace)
+        self.update = tuple(column for column in self.columns if column not in self.key) \
+            if update is None else tuple(update)
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+
+        self._key_index = tuple(self.columns.index(column) for column in self.key)
+        self._stage = f"_stage_{table}" if scope is None else f"_stage_{table}_{scope}"
+        self._batch: t.Optional[_Batch] = None
+        self._wakeup = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._task: t.Optional[asyncio.Task[None]] = None
+        self._closing: bool = False
+        self._flushing: set[asyncio.Task[None]] = set()
+        self._merging: int = 0
+
+        self.flushes: int = 0
+        self.rows: int = 0
+        self.failed: int = 0
+        self.replaced: int = 0
+        self.conflicts: int = 0
+
+        self._build_statements()
+
+    def _build_statements(self) -> None:
+        def joined(alias: str, columns: t.Iterable[str]) -> str:
+            return ", ".join(f'{alias}"{column}"' for column in columns)
+
+        def matched(columns: t.Iterable[str]) -> str:
+            return " AND ".join(f't."{column}" = s."{column}"' for column in columns)
+
+        match = matched(self.key)
+        fields = self.update
+        assignments = ", ".join(f'"{field}" = s."{field}"' for field in fields)
+
+        self._create = (f'CREATE TEMP TABLE IF NOT EXISTS "{self._stage}" ON COMMIT DELETE ROWS '
+                        f'AS SELECT {joined("", self.columns)} FROM "{self.table}" WITH NO DATA')
+        self._update = (
+            f'UPDATE "{self.table}" AS t SET {assignments} '
+            f'FROM "{self._stage}" s WHERE {match} '
+            f'AND ({joined("t.", fields)}) IS DISTINCT FROM ({joined("s.", fields)})'
+        ) if fields else None
+        self._replace = [
+            f'DELETE FROM "{self.table}" t USING "{self._stage}" s WHERE {matched(columns)} '
+            f'AND ({joined("t.", self.key)}) IS DISTINCT FROM ({joined("s.", self.key)})'
+            for columns in self.replace
+        ]
+        # Returns the number of new rows and of the inserted ones, the rest hit a unique key
+        self._insert = (
+            f'WITH n AS (SELECT {joined("s.", self.columns)} FROM "{self._stage}" s '
+            f'WHERE NOT EXISTS (SELECT 1 FROM "{self.table}" t WHERE {match})), '
+            f'i AS (INSERT INTO "{self.table}" ({joined("", self.columns)}) '
+            f'SELECT {joined("", self.columns)} FROM n ON CONFLICT DO NOTHING RETURNING 1) '
+            'SELECT (SELECT count(*) FROM n), (SELECT count(*) FROM i)'
+        )
+        self._delete = (
+            f'DELETE FROM "{self.table}" t WHERE t."{self.scope}" = ANY($1::bigint[]) '
+            f'AND NOT EXISTS (SELECT 1 FROM "{self._stage}" s WHERE {match})'
+        ) if self.scope else None
+
+    @property
+    def pending(self) -> int:
+        """Rows added but not committed yet"""
+        return (len(self._batch.rows) if self._batch is not None else 0) + self._merging
+
+    def start(self) -> None:
+        if self._task is None:
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flushes what is buffered and stops the flusher, a merge in progress is awaited"""
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        if self._flushing:
+            await asyncio.wait(self._flushing)
+
+    async def add(self, rows: t.Iterable[tuple], scope: t.Iterable[int] = ()) -> SyncResult:
+        """Queues rows and returns the merge result of the batch they were committed with.
+
+        ``scope`` lists the owners (values of the scope column) these rows are the full set of.
+        """
+        while self.pending >= self.max_pending:
+            self._drained.clear()
+            await self._drained.wait()
+
+        if self._batch is None:
+            self._batch = _Batch()
+            self._wakeup.set()
+        batch = self._batch
+        for row in rows:
+            batch.rows[tuple(row[i] for i in self._key_index)] = row
+        batch.scope.update(scope)
+        if len(batch.rows) >= self.max_rows:
+            self._batch = None
+            task = asyncio.create_task(self._flush(batch))
+            self._flushing.add(task)
+            task.add_done_callback(self._flushing.discard)
+
+        return await asyncio.shield(batch.done)
+
+    async def _run(self) -> None:
+        while not self._closing:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            batch = self._batch
+            if batch is None:
+                continue
+
+            # Full batches are flushed by add, here the ones that got old enough
+            if not self._closing:
+                await asyncio.sleep(max(batch.opened_at + self.max_delay - time.monotonic(), 0))
+            if self._batch is batch:
+                self._batch = None
+                await self._flush(batch)
+
+    async def flush(self) -> None:
+        """Merges the current batch right away"""
+        batch, self._batch = self._batch, None
+        if batch is not None:
+            await self._flush(batch)
+
+    async def _flush(self, batch: _Batch) -> None:
+        self._merging += len(batch.rows)
+        try:
+            result = await self._merge(batch)
+        except Exception as ex:
+            self.failed += len(batch.rows)
+            logger.exception("Failed to merge {} rows into {}", len(batch.rows), self.table)
+            batch.done.set_exception(ex)
+            # Retrieved here, the writers may be gone on shutdown
+            batch.done.exception()
+        else:
+            self.flushes += 1
+            self.rows += len(batch.rows)
+            batch.done.set_result(result)
+        finally:
+            # Cancelled mid-merge, the writers must not wait forever
+            if not batch.done.done():
+                batch.done.cancel()
+            self._merging -= len(batch.rows)
+            self._drained.set()
+
+    async def _merge(self, batch: _Batch) -> SyncResult:
+        result = SyncResult()
+        db = Tortoise.get_connection("default")
+        async with db.acquire_connection() as connection, connection.transaction():
+            await connection.execute(self._create)
+            await connection.copy_records_to_table(self._stage, records=list(batch.rows.values()),
+                                                   columns=self.columns)
+            for columns, statement in zip(self.replace, self._replace):
+                replaced = _count(await connection.execute(statement))
+                if replaced:
+                    self.replaced += replaced
+                    result.deleted += replaced
+                    logger.info("Replaced {} rows of {} holding the same {}", replaced, self.table, columns)
+            if self._update is not None:
+                result.updated = _count(await connection.execute(self._update))
+            new, result.created = await connection.fetchrow(self._insert)
+            if new > result.created:
+                self.conflicts += new - result.created
+                logger.warning("Skipped {} new rows of {} conflicting with a unique key",
+                               new - result.created, self.table)
+            if self._delete is not None:
+                result.deleted += _count(await connection.execute(self._delete, list(batch.scope)))
+        return result
+
+    def stats(self) -> dict[str, t.Any]:
+        return {"pending": self.pending, "flushes": self.flushes, "rows": self.rows, "failed": self.failed,
+                "replaced": self.replaced, "conflicts": self.conflicts}
+
+
+class IngestPipeline:
+    """Buffers of the tables written by ScheduleService.fetch_schedule and fetch_exams"""
+
+    subject_columns = ("schedule_id", "employee_id", "number", "group_id", "name", "sub_group", "audience",
+                       "building", "type", "zoom_link", "zoom_password")
+    exam_columns = ("date", "number", "sub_group", "group_id", "employee_id", "day", "name", "dislocation", "type",
+                    "time", "zoom_link", "zoom_password")
+    snapshot_columns = ("type", "object_id", "week", "payload", "etag", "datetime")
+
+    def __init__(self, max_rows: int, max_delay: float, max_pending: int) -> None:
+        limits = {"max_rows": max_rows, "max_delay": max_delay, "max_pending": max_pending}
+        # A lesson of a group taken over by another employee replaces the row of the previous one.
+        # A lesson shared by several groups keeps the group it was stored with, as the inline upsert does
+        self.subjects = CopyBuffer("subject", self.subject_columns, ("schedule_id", "employee_id", "number"),
+                                   replace=(("schedule_id", "group_id", "number"),),
+                                   update=("name", "sub_group", "audience", "building", "type", "zoom_link",
+                                           "zoom_password"), **limits)
+        exam_key = ("date", "number", "sub_group", "group_id", "employee_id")
+        self.group_exams = CopyBuffer("exam", self.exam_columns, exam_key, scope="group_id", **limits)
+        self.employee_exams = CopyBuffer("exam", self.exam_columns, exam_key, scope="employee_id", **limits)
+        self.snapshots = CopyBuffer("schedule_snapshot", self.snapshot_columns, ("type", "object_id", "week"),
+                                    **limits)
+
+    @property
+    def buffers(self) -> dict[str, CopyBuffer]:
+        return {"subjects": self.subjects, "group_exams": self.group_exams,
+                "employee_exams": self.employee_exams, "snapshots": self.snapshots}
+
+    def start(self) -> None:
+        for buffer in self.buffers.values():
+            buffer.start()
+
+    async def stop(self) -> None:
+        await asyncio.gather(*(buffer.stop() for buffer in self.buffers.values()))
+
+    def stats(self) -> dict[str, dict[str, t.Any]]:
+        return {name: buffer.stats() for name, buffer in self.buffers.items()}
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import asyncio
+import time
+import typing as t
+
+from loguru import logger
+
+__all__: t.Sequence[str] = ("CrawlProgress", "ReferenceCrawler")
+
+
+class CrawlProgress:
+    """Progress of a reference data crawl"""
+
+    __slots__ = ("total", "done", "failures", "started_at", "finished_at")
+
+    def __init__(self) -> None:
+        self.total: int = 0
+        self.done: int = 0
+        self.failures: dict[int, str] = {}
+        self.started_at: float = time.monotonic()
+        self.finished_at: t.Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def to_dict(self) -> dict[str, t.Any]:
+        return {
+            "total": self.total,
+            "done": self.done,
+            "failures": {str(k): v for k, v in self.failures.items()},
+            "finished": self.finished,
+            "elapsed": round(self.elapsed, 3),
+        }
+
+
+class _FacultyData(t.NamedTuple):
+    departments: list
+    groups: dict
+    employees: dict[int, list]
+
+
+class ReferenceCrawler:
+    """Walks faculties → departments → employees and groups concurrently.
+
+    Every fetch unit (one ``fetch_*`` call) holds one permit of the semaphore,
+    so at most ``concurrency`` fetches are in flight at once. A failing faculty
+    is recorded in :attr:`progress` and does not abort the rest of the crawl.
+
+    Departments, groups and employees of all crawled faculties are saved once the fetches
+    are done, one transaction per table, so a row that moved to another faculty or department
+    is updated instead of being deleted with everything referencing it.
+    """
+
+    def __init__(self, service, concurrency: int) -> None:
+        self.service = service
+        self.progress = CrawlProgress()
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def _limited(self, func: t.Callable[..., t.Awaitable[t.Any]], *args: t.Any) -> t.Any:
+        async with self._semaphore:
+            return await func(*args)
+
+    async def run(self) -> CrawlProgress:
+        faculties = await self.service.fetch_faculties()
+        self.progress.total = len(faculties)
+        started = time.monotonic()
+
+        results = await asyncio.gather(*(self._crawl_faculty(faculty.id) for faculty in faculties))
+        crawled = {faculty.id: data for faculty, data in zip(faculties, results) if data is not None}
+        if crawled:
+            await self.service.sync_departments({faculty_id: data.departments
+                                                 for faculty_id, data in crawled.items()}, started)
+            await self.service.sync_groups({faculty_id: data.groups
+                                            for faculty_id, data in crawled.items() if data.groups}, started)
+            await self.service.sync_employees({department_id: employees
+                                               for data in crawled.values()
+                                               for department_id, employees in data.employees.items()}, started)
+
+        self.progress.finished_at = time.monotonic()
+        logger.info("Crawl finished in {:.2f}s, {} faculties, {} failed",
+                    self.progress.elapsed, self.progress.total, len(self.progress.failures))
+        return self.progress
+
+    async def _crawl_faculty(self, faculty_id: int) -> t.Optional[_FacultyData]:
+        try:
+            departments, groups = await asyncio.gather(
+                self._limited(self.service.fetch_departments, faculty_id, False),
+                self._limited(self.service.fetch_groups, faculty_id, False),
+            )
+            employees = await asyncio.gather(*(self._limited(self.service.fetch_employees, department.id, False)
+                                               for department in departments))
+            return _FacultyData(departments, groups,
+                                {department.id: models for department, models in zip(departments, employees)})
+        except Exception as ex:
+            self.progress.failures[faculty_id] = repr(ex)
+            logger.exception("Failed to crawl {} faculty", faculty_id)
+            return None
+        finally:
+            self.progress.done += 1
+            logger.info("Crawl progress {}/{}", self.progress.done, self.progress.total)
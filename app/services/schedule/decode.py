@@ -0,0 +1,140 @@
+import functools
+import typing
+from datetime import datetime
+
+from app.models.enums import DayType, SubjectType, subject_type_ru
+
+__all__: typing.Sequence[str] = ("ScheduleEntryRecord", "ExamRecord")
+
+# Upstream sends days of the week starting from 1
+_DAYS: dict[typing.Any, DayType] = {day.value + 1: day for day in DayType}
+
+
+def _str(value) -> str:
+    if type(value) is str:
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise ValueError(f"str expected, got {value!r}")
+
+
+def _optional_str(value) -> typing.Optional[str]:
+    return None if value is None else _str(value)
+
+
+def _int(value) -> int:
+    return value if type(value) is int else int(value)
+
+
+def _day(value) -> DayType:
+    try:
+        return _DAYS[value]
+    except (KeyError, TypeError):
+        raise ValueError(f"Unknown day of the week {value!r}") from None
+
+
+def _subject_type(value) -> SubjectType:
+    try:
+        return subject_type_ru[value]
+    except (KeyError, TypeError):
+        raise ValueError(f"Unknown subject type {value!r}") from None
+
+
+# A crawl sees only a semester worth of distinct dates
+@functools.lru_cache(maxsize=1024)
+def _iso_date(value: str) -> int:
+    return int(datetime.strptime(value, "%Y-%m-%d").timestamp())
+
+
+@functools.lru_cache(maxsize=1024)
+def _ru_date(value: str) -> int:
+    return int(datetime.strptime(value, "%d.%m.%Y").timestamp())
+
+
+class _Record:
+    """Slotted counterpart of a pydantic model of the upstream API, decoded without validation machinery.
+
+    ``_fields`` lists (attribute, upstream key, converter, required) in the field order of the model,
+    converters coerce values exactly as the validators of the model do.
+    """
+
+    __slots__ = ()
+    _fields: typing.ClassVar[tuple[tuple[str, str, typing.Callable[[typing.Any], typing.Any], bool], ...]]
+
+    @classmethod
+    def parse_obj(cls, raw: dict):
+        self = cls.__new__(cls)
+        for name, alias, convert, required in cls._fields:
+            value = raw.get(alias)
+            if value is None:
+                if required:
+                    raise ValueError(f"{cls.__name__}.{name}: field {alias!r} is required")
+                setattr(self, name, None)
+            else:
+                setattr(self, name, convert(value))
+        return self
+
+    def dict(self, *, exclude: typing.Optional[typing.AbstractSet[str]] = None) -> dict[str, typing.Any]:
+        exclude = exclude or ()
+        return {name: getattr(self, name) for name in self.__slots__ if name not in exclude}
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, _Record):
+            return self.dict() == other.dict()
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({', '.join(f'{k}={v!r}' for k, v in self.dict().items())})"
+
+
+class ScheduleEntryRecord(_Record):
+    """Fast decoder of models.ScheduleEntryHTTP"""
+
+    __slots__ = ("id", "name", "type", "subject_id", "title", "department_name", "date", "day", "sub_group",
+                 "building", "audience", "number", "employee_id", "employee_name", "employee_second_name",
+                 "employee_middle_name", "group_id", "zoom_link", "zoom_password")
+    _fields = (
+        ("id", "id_cell", _str, True),
+        ("name", "TitleSubject", _str, True),
+        ("type", "TypeLesson", _subject_type, True),
+        ("subject_id", "idSubject", _int, True),
+        ("title", "title", _str, True),
+        ("department_name", "special", _str, True),
+        ("date", "DateLesson", _iso_date, True),
+        ("day", "DayWeek", _day, True),
+        ("sub_group", "NumberSubGruop", _int, True),
+        ("building", "Korpus", _str, True),
+        ("audience", "NumberRoom", _str, True),
+        ("number", "NumberLesson", _int, True),
+        ("employee_id", "employee_id", _int, True),
+        ("employee_name", "Name", _str, True),
+        ("employee_second_name", "Family", _str, True),
+        ("employee_middle_name", "SecondName", _str, True),
+        ("group_id", "idGruop", _int, True),
+        ("zoom_link", "zoom_link", _optional_str, False),
+        ("zoom_password", "zoom_password", _optional_str, False),
+    )
+
+
+class ExamRecord(_Record):
+    """Fast decoder of models.ExamHTTP"""
+
+    __slots__ = ("photo_link", "id", "name", "type", "date", "day", "sub_group", "dislocation", "number", "time",
+                 "employee_id", "employee_name", "employee_second_name", "employee_middle_name", "group_id")
+    _fields = (
+        ("photo_link", "foto_link", _str, True),
+        ("id", "id_cell", _str, True),
+        ("name", "TitleSubject", _str, True),
+        ("type", "TypeLesson", _subject_type, True),
+        ("date", "DateLesson", _ru_date, True),
+        ("day", "DayWeek", _day, True),
+        ("sub_group", "NumberSubGruop", _int, True),
+        ("dislocation", "NumberRoom", _str, True),
+        ("number", "NumberLesson", _int, True),
+        ("time", "Time", _str, True),
+        ("employee_id", "employee_id", _int, True),
+        ("employee_name", "Name", _str, True),
+        ("employee_second_name", "Family", _str, True),
+        ("employee_middle_name", "SecondName", _str, True),
+        ("group_id", "idGruop", _int, True),
+    )
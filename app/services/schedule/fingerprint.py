@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import hashlib
+import typing as t
+
+__all__: t.Sequence[str] = ("UNCHANGED", "FingerprintStore")
+
+
+class _Unchanged:
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "UNCHANGED"
+
+
+UNCHANGED: t.Final = _Unchanged()
+"""Returned by HTTPClient instead of the payload when it is byte-identical to the last ingested one"""
+
+_staged: contextvars.ContextVar[t.Optional[dict[str, bytes]]] = contextvars.ContextVar("fingerprints", default=None)
+
+
+class FingerprintStore:
+    """Hashes of the last ingested raw payload per ``Route.url``.
+
+    Payloads are only compared inside :meth:`track`; a new hash is committed
+    when the tracked block exits cleanly, so a failed write is retried on the next refresh.
+    """
+
+    __slots__ = ("_digests", "checks", "hits")
+
+    def __init__(self) -> None:
+        self._digests: dict[str, bytes] = {}
+        self.checks: int = 0
+        self.hits: int = 0
+
+    @staticmethod
+    def digest(payload: bytes) -> bytes:
+        return hashlib.blake2b(payload, digest_size=16).digest()
+
+    @property
+    def tracking(self) -> bool:
+        return _staged.get() is not None
+
+    def check(self, url: str, payload: bytes) -> bool:
+        """Returns True if ``payload`` is unchanged, otherwise stages its hash for the tracked block."""
+        staged = _staged.get()
+        if staged is None:
+            return False
+
+        digest = self.digest(payload)
+        self.checks += 1
+        if self._digests.get(url) == digest:
+            self.hits += 1
+            return True
+
+        staged[url] = digest
+        return False
+
+    def forget(self, url: str) -> None:
+        self._digests.pop(url, None)
+
+    @contextlib.contextmanager
+    def track(self) -> t.Iterator[None]:
+        staged: dict[str, bytes] = {}
+        token = _staged.set(staged)
+        try:
+            yield
+        finally:
+            _staged.reset(token)
+        self._digests.update(staged)
+
+    def stats(self) -> dict[str, int]:
+        return {"checks": self.checks, "hits": self.hits, "misses": self.checks - self.hits,
+                "size": len(self._digests)}
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import typing as t
+from datetime import datetime, timedelta
+
+import pytz
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+from app.models.db import LastUpdateModel
+from app.models.enums import ActionStats
+
+__all__: t.Sequence[str] = ("FreshnessIndex", "FreshnessMark")
+
+# Rows are stamped by the clocks of several hosts, refresh reads this far back from the newest row it saw
+_CLOCK_SKEW = timedelta(minutes=1)
+
+
+class FreshnessMark(t.NamedTuple):
+    action: ActionStats
+    object_id: int
+    week: int
+    when: datetime
+
+
+class FreshnessIndex:
+    """Time of the last fetch per (action, object_id, week), kept in memory and in the last_update table.
+
+    ``object_id`` 0 stands for fetches not bound to an object, like the full data crawl. ``week`` is the
+    start of the fetched week for schedules, 0 for everything else.
+    """
+
+    __slots__ = ("_updates", "_latest", "_newest")
+
+    def __init__(self) -> None:
+        self._updates: dict[tuple[ActionStats, int, int], datetime] = {}
+        self._latest: dict[ActionStats, datetime] = {}
+        self._newest: t.Optional[datetime] = None
+
+    def _remember(self, action: ActionStats, object_id: int, week: int, when: datetime) -> bool:
+        """Returns False if the index already knows this or a later fetch"""
+        known = self._updates.get((action, object_id, week))
+        if known is not None and known >= when:
+            return False
+        self._updates[(action, object_id, week)] = when
+        if action not in self._latest or self._latest[action] < when:
+            self._latest[action] = when
+        return True
+
+    async def load(self) -> None:
+        await self.refresh()
+
+    async def refresh(self) -> list[tuple[ActionStats, int, int]]:
+        """Reads the fetches other processes recorded since the last call, returns their keys"""
+        query = LastUpdateModel.all()
+        if self._newest is not None:
+            query = query.filter(datetime__gt=self._newest - _CLOCK_SKEW)
+
+        changed = []
+        for row in await query:
+            if self._remember(row.action, row.object_id, row.week, row.datetime):
+                changed.append((row.action, row.object_id, row.week))
+            if self._newest is None or self._newest < row.datetime:
+                self._newest = row.datetime
+        return changed
+
+    def get(self, action: ActionStats, object_id: t.Optional[int] = None, week: int = 0) -> t.Optional[datetime]:
+        """Last fetch of the object (and week), or of any object of the action if ``object_id`` is None"""
+        if object_id is None:
+            return self._latest.get(action)
+        return self._updates.get((action, object_id, week))
+
+    async def mark(
+            self,
+            action: ActionStats,
+            object_id: t.Optional[int] = None,
+            week: int = 0,
+            using_db: t.Optional[BaseDBAsyncClient] = None
+    ) -> FreshnessMark:
+        """Records a fetch. Inside a transaction (``using_db``) the index is not updated, the caller
+        passes the returned mark to ``remember`` once the transaction has committed.
+        """
+        when = datetime.now(pytz.utc)
+        await LastUpdateModel.bulk_create([LastUpdateModel(action=action, object_id=object_id or 0, week=week,
+                                                           datetime=when)],
+                                          on_conflict=("action", "object_id", "week"),
+                                          update_fields=("datetime",),
+                                          using_db=using_db)
+        mark = FreshnessMark(action, object_id or 0, week, when)
+        if using_db is None:
+            self.remember(mark)
+        return mark
+
+    def remember(self, mark: FreshnessMark) -> None:
+        self._remember(*mark)
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import typing as t
+
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.expressions import Q
+from tortoise.models import Model
+
+__all__: t.Sequence[str] = ("SyncResult", "sync_rows")
+
+M = t.TypeVar("M", bound=Model)
+
+
+class SyncResult:
+    """Change counts of a single :func:`sync_rows` call.
+
+    ``attempted`` counts new rows sent to an insert that skips unique key conflicts, how many of
+    them a concurrent sync inserted first is unknown. ``created`` only counts rows surely inserted.
+    """
+
+    __slots__ = ("created", "updated", "deleted", "attempted")
+
+    def __init__(self, created: int = 0, updated: int = 0, deleted: int = 0, attempted: int = 0) -> None:
+        self.created = created
+        self.updated = updated
+        self.deleted = deleted
+        self.attempted = attempted
+
+    def __bool__(self) -> bool:
+        return bool(self.created or self.updated or self.deleted or self.attempted)
+
+    def __iadd__(self, other: SyncResult) -> SyncResult:
+        self.created += other.created
+        self.updated += other.updated
+        self.deleted += other.deleted
+        self.attempted += other.attempted
+        return self
+
+    def __repr__(self) -> str:
+        return (f"<SyncResult created={self.created} updated={self.updated} deleted={self.deleted} "
+                f"attempted={self.attempted}>")
+
+    def to_dict(self) -> dict[str, int]:
+        return {"created": self.created, "updated": self.updated, "deleted": self.deleted,
+                "attempted": self.attempted}
+
+
+def _pk_key(model: Model) -> t.Hashable:
+    return model.pk
+
+
+async def sync_rows(
+        model: t.Type[M],
+        fetched: t.Sequence[M],
+        scope: Q,
+        fields: t.Sequence[str],
+        using_db: BaseDBAsyncClient,
+        key: t.Callable[[M], t.Hashable] = _pk_key,
+) -> SyncResult:
+    """Bring the rows of ``model`` matched by ``scope`` in line with ``fetched``.
+
+    Rows are matched by ``key`` (the primary key by default) and compared on ``fields``;
+    only new rows are inserted, only changed rows are updated and only vanished rows are deleted.
+    Should be called inside a transaction, ``using_db`` being its connection.
+    """
+    existing = {key(row): row for row in await model.filter(scope).using_db(using_db)}
+    result = SyncResult()
+
+    to_create: list[M] = []
+    to_update: list[M] = []
+    for row in fetched:
+        stored = existing.pop(key(row), None)
+        if stored is None:
+            to_create.append(row)
+            continue
+
+        row.pk = stored.pk
+        row._saved_in_db = True
+        if any(getattr(stored, field) != getattr(row, field) for field in fields):
+            to_update.append(row)
+
+    if to_create:
+        # A row may have moved in from another scope (e.g. a department to another faculty)
+        if key is _pk_key:
+            await model.bulk_create(to_create, on_conflict=(model._meta.pk_attr,), update_fields=fields,
+                                    using_db=using_db)
+            result.created = len(to_create)
+        else:
+            # The key is a unique key too, a concurrent sync of another scope may have inserted the row
+            await model.bulk_create(to_create, ignore_conflicts=True, using_db=using_db)
+            result.attempted = len(to_create)
+    if to_update:
+        await model.bulk_update(to_update, fields=fields, using_db=using_db)
+        result.updated = len(to_update)
+    if existing:
+        stale = Q(**{f"{model._meta.pk_attr}__in": [row.pk for row in existing.values()]})
+        result.deleted = await model.filter(scope & stale).using_db(using_db).delete()
+
+    return result
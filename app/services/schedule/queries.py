@@ -0,0 +1,102 @@
+import typing as t
+
+from app.models.enums import UserType
+
+__all__: t.Sequence[str] = ("owner_column", "WEEK_ROWS", "WEEK_DOCUMENT", "BATCH_WEEK_DOCUMENTS", "EXAMS_DOCUMENT")
+
+
+def owner_column(user_type: UserType) -> str:
+    """Subject and exam column holding the owner of a schedule"""
+    return '"group_id"' if user_type == UserType.Student else '"employee_id"'
+
+
+# Every schedule day of the week with the subjects of one owner, one row per subject
+# (or a single row with NULL subject columns for a day without subjects).
+# {owner} is owner_column(), served by the (group_id, schedule_id) / (employee_id, schedule_id) indexes.
+WEEK_ROWS = (
+    'SELECT s."id" AS "schedule_id", s."day", s."date", '
+    'sub."id", sub."name", sub."sub_group", sub."audience", sub."building", sub."number", sub."type", '
+    'sub."zoom_link", sub."zoom_password", '
+    'sub."group_id", g."name" AS "group_name", g."direction" AS "group_direction", '
+    'g."course" AS "group_course", g."level" AS "group_level", g."faculty_id" AS "group_faculty_id", '
+    'sub."employee_id", e."name" AS "employee_name", e."second_name" AS "employee_second_name", '
+    'e."middle_name" AS "employee_middle_name", e."department_id" AS "employee_department_id" '
+    'FROM "schedule" s '
+    'LEFT JOIN "subject" sub ON sub."schedule_id" = s."id" AND sub.{owner} = $1 '
+    'LEFT JOIN "group" g ON g."id" = sub."group_id" '
+    'LEFT JOIN "employee" e ON e."id" = sub."employee_id" '
+    'WHERE s."date" >= $2 AND s."date" < $3 '
+    'ORDER BY s."day", sub."number"'
+)
+
+
+# Same object as snapshot._subject, compare parsed documents: Postgres spaces its JSON differently
+_SUBJECT_OBJECT = (
+    "json_build_object("
+    "'name', sub.\"name\", 'type', sub.\"type\", 'number', sub.\"number\", 'sub_group', sub.\"sub_group\", "
+    "'building', sub.\"building\", 'audience', sub.\"audience\", "
+    "'zoom_link', sub.\"zoom_link\", 'zoom_password', sub.\"zoom_password\", "
+    "'group', json_build_object('id', g.\"id\", 'name', g.\"name\"), "
+    "'employee', json_build_object('id', e.\"id\", 'name', e.\"name\", 'second_name', e.\"second_name\", "
+    "'middle_name', e.\"middle_name\"))"
+)
+
+
+def _day_subjects(schedule_id: str, owner_id: str) -> str:
+    """JSON array of the subjects of one owner on one schedule day, keeps {owner} for owner_column()"""
+    return (
+        "COALESCE(("
+        f"SELECT json_agg({_SUBJECT_OBJECT} ORDER BY sub.\"number\") "
+        'FROM "subject" sub '
+        'LEFT JOIN "group" g ON g."id" = sub."group_id" '
+        'LEFT JOIN "employee" e ON e."id" = sub."employee_id" '
+        f'WHERE sub."schedule_id" = {schedule_id} AND sub.{{owner}} = {owner_id}'
+        "), '[]'::json)"
+    )
+
+
+# The whole week document of one owner in the shape of snapshot.build_week_document, as UTF-8 bytes.
+# Parameters: owner id, week start, start of the next week; days without a schedule row get their computed date.
+WEEK_DOCUMENT = (
+    "SELECT convert_to(json_build_object('week', $2::bigint, 'days', json_agg(json_build_object("
+    "'day', d.\"day\", "
+    "'date', COALESCE(s.\"date\", $2::bigint + 86400 * d.\"day\"), "
+    "'subjects', " + _day_subjects('s."id"', "$1") +
+    ') ORDER BY d."day"))::text, \'UTF8\') '
+    'FROM generate_series(0, 5) AS d("day") '
+    'LEFT JOIN "schedule" s ON s."day" = d."day" AND s."date" >= $2::bigint AND s."date" < $3::bigint'
+)
+
+# (owner id, week document) of every owner in a batch, the week's days are resolved once.
+# Parameters: owner ids, week start, start of the next week.
+BATCH_WEEK_DOCUMENTS = (
+    'WITH w AS ('
+    "SELECT d.\"day\", COALESCE(s.\"date\", $2::bigint + 86400 * d.\"day\") AS \"date\", s.\"id\" "
+    'FROM generate_series(0, 5) AS d("day") '
+    'LEFT JOIN "schedule" s ON s."day" = d."day" AND s."date" >= $2::bigint AND s."date" < $3::bigint'
+    ') '
+    "SELECT o.\"id\", convert_to(json_build_object('week', $2::bigint, 'days', ("
+    "SELECT json_agg(json_build_object("
+    "'day', w.\"day\", 'date', w.\"date\", "
+    "'subjects', " + _day_subjects('w."id"', 'o."id"') +
+    ') ORDER BY w."day") FROM w'
+    '))::text, \'UTF8\') '
+    'FROM unnest($1::int[]) WITH ORDINALITY AS o("id", "position") '
+    'ORDER BY o."position"'
+)
+
+# Every exam of one owner as a JSON array, as UTF-8 bytes. Parameter: owner id.
+EXAMS_DOCUMENT = (
+    "SELECT convert_to(COALESCE(json_agg(json_build_object("
+    "'id', x.\"id\", 'day', x.\"day\", 'date', x.\"date\", 'name', x.\"name\", 'sub_group', x.\"sub_group\", "
+    "'dislocation', x.\"dislocation\", 'number', x.\"number\", 'type', x.\"type\", 'time', x.\"time\", "
+    "'zoom_link', x.\"zoom_link\", 'zoom_password', x.\"zoom_password\", "
+    "'group', json_build_object('id', g.\"id\", 'name', g.\"name\"), "
+    "'employee', json_build_object('id', e.\"id\", 'name', e.\"name\", 'second_name', e.\"second_name\", "
+    "'middle_name', e.\"middle_name\")"
+    ') ORDER BY x."date", x."number"), \'[]\'::json)::text, \'UTF8\') '
+    'FROM "exam" x '
+    'LEFT JOIN "group" g ON g."id" = x."group_id" '
+    'LEFT JOIN "employee" e ON e."id" = x."employee_id" '
+    'WHERE x.{owner} = $1'
+)
@@ -0,0 +1,42 @@
+import typing as t
+
+from app.models.db import ScheduleReadModel
+from app.models.enums import ActionStats, UserType
+
+__all__: t.Sequence[str] = ("ReadLog",)
+
+_ADD = (
+    'INSERT INTO "schedule_read" AS r ("action", "type", "object_id", "week", "reads") '
+    "SELECT * FROM unnest($1::smallint[], $2::smallint[], $3::bigint[], $4::bigint[], $5::int[]) "
+    'ON CONFLICT ("action", "type", "object_id", "week") DO UPDATE SET "reads" = r."reads" + EXCLUDED."reads"'
+)
+# Tortoise drops the RETURNING rows of statements starting with DELETE, the CTE keeps them
+_DRAIN = (
+    'WITH d AS (DELETE FROM "schedule_read" RETURNING "action", "type", "object_id", "week", "reads") '
+    "SELECT * FROM d"
+)
+
+
+class ReadLog:
+    """Reads counted by the workers that do not run the RefreshScheduler, in the schedule_read table.
+
+    Followers add the reads they served, the leader drains them into its scheduler, so the
+    popularity of an item covers the reads of the whole deployment.
+    """
+
+    @classmethod
+    async def add(cls, reads: t.Mapping[tuple[ActionStats, UserType, int, int], int]) -> None:
+        """Adds (action, type, object_id, week) -> reads, in one statement"""
+        if not reads:
+            return
+        keys, counts = zip(*reads.items())
+        actions, types, object_ids, weeks = zip(*keys)
+        await ScheduleReadModel._meta.db.execute_query(
+            _ADD, [[a.value for a in actions], [u.value for u in types], list(object_ids), list(weeks), list(counts)])
+
+    @classmethod
+    async def drain(cls) -> list[tuple[ActionStats, UserType, int, int, int]]:
+        """Takes every counted read out of the table"""
+        _, rows = await ScheduleReadModel._meta.db.execute_query(_DRAIN)
+        return [(ActionStats(row["action"]), UserType(row["type"]), row["object_id"], row["week"], row["reads"])
+                for row in rows]
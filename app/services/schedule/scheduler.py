@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import asyncio
+import collections
+import heapq
+import random
+import time
+import typing as t
+from datetime import datetime
+
+import pytz
+from loguru import logger
+
+import config
+from app.models.enums import ActionStats
+from app.services.jobs import JobQueue
+from app.utils.time import ScheduleTime
+
+__all__: t.Sequence[str] = ("RefreshScheduler",)
+
+# Below this decayed read count an item is considered abandoned and stops being refreshed
+_MIN_POPULARITY = 0.05
+# Popular items are refreshed up to this share of the interval before they become stale,
+# so among items due at the same time the most read ones go first
+_POPULARITY_LEAD = 0.1
+# Max distinct items whose reads a stopped scheduler keeps until they are forwarded to the leader
+_MAX_FORWARDED = 100_000
+
+
+class RefreshItem:
+    __slots__ = ("user", "action", "week_delta", "popularity", "touched_at", "refreshed_at", "due", "version")
+
+    def __init__(self, user, action: ActionStats, week_delta: int, now: float) -> None:
+        self.user = user
+        self.action = action
+        self.week_delta = week_delta
+        self.popularity: float = 0.0
+        self.touched_at: float = now
+        self.refreshed_at: t.Optional[float] = None
+        self.due: float = now
+        self.version: int = 0
+
+    @property
+    def key(self) -> tuple:
+        return self.action, self.user.type, self.user.id, self.week_delta
+
+    def decayed_popularity(self, now: float, half_life: float) -> float:
+        return self.popularity * 0.5 ** ((now - self.touched_at) / half_life)
+
+
+class RefreshScheduler:
+    """Keeps read schedules and exams fresh in the background.
+
+    Every read ``touch``-es its (group or employee, week) item. Items sit in a heap ordered by
+    the moment they become stale, known from the last fetch in the freshness index, brought
+    forward the more the item is read. Refreshes are spread with jitter, and items nobody reads
+    any more decay out of the queue. Upstream requests still go
+    through the global budget of HTTPClient.
+
+    Only the leader runs the scheduler, the other workers keep their reads for ``take_forwarded``.
+    """
+
+    def __init__(self, service, concurrency: int) -> None:
+        self.service = service
+        self._items: dict[tuple, RefreshItem] = {}
+        self._heap: list[tuple[float, float, int, tuple]] = []
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._task: t.Optional[asyncio.Task[None]] = None
+        self._forwarded: collections.Counter[tuple] = collections.Counter()
+        self._refreshing: set[asyncio.Task[None]] = set()
+
+        self.in_flight: int = 0
+        self.refreshed: int = 0
+        self.failed: int = 0
+
+    @staticmethod
+    def interval(action: ActionStats) -> float:
+        if action == ActionStats.fetch_exams:
+            return config.UPDATE_FETCH_EXAMS.total_seconds()
+        return config.UPDATE_FETCH_SCHEDULE.total_seconds()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def touch(self, user, action: ActionStats, week_delta: int = 0, reads: int = 1) -> None:
+        """Records reads, registering the item on its first one. A stopped scheduler keeps them to forward"""
+        key = (action, user.type, user.id, week_delta)
+        if self._task is None:
+            if key in self._forwarded or len(self._forwarded) < _MAX_FORWARDED:
+                self._forwarded[key] += reads
+            return
+        now = time.monotonic()
+        interval = self.interval(action)
+
+        item = self._items.get(key)
+        is_new = item is None
+        if is_new:
+            item = self._items[key] = RefreshItem(user, action, week_delta, now)
+
+        item.popularity = item.decayed_popularity(now, interval) + reads
+        item.touched_at = now
+        if is_new:
+            self._push(item, self._stale_at(item, now))
+
+    def take_forwarded(self) -> dict[tuple, int]:
+        """Returns and forgets the reads counted while stopped, keyed (action, type, id, week_delta)"""
+        forwarded, self._forwarded = self._forwarded, collections.Counter()
+        return forwarded
+
+    def _stale_at(self, item: RefreshItem, now: float) -> float:
+        """Monotonic time the stored data of the item becomes stale, now if it was never fetched"""
+        week = ScheduleTime.compute_timestamp(week_delta=item.week_delta) \
+            if item.action == ActionStats.fetch_schedule else 0
+        fetched_at = self.service.freshness.get(item.action, item.user.id, week)
+        if fetched_at is None:
+            return now
+        age = (datetime.now(pytz.utc) - fetched_at).total_seconds()
+        return now + max(self.interval(item.action) * random.uniform(0.9, 1.0) - age, 0.0)
+
+    def _push(self, item: RefreshItem, stale_at: float) -> None:
+        interval = self.interval(item.action)
+        popularity = item.decayed_popularity(time.monotonic(), interval)
+        item.version += 1
+        item.due = stale_at - interval * _POPULARITY_LEAD * (1 - 0.5 ** popularity)
+        heapq.heappush(self._heap, (item.due, -popularity, item.version, item.key))
+        self._wakeup.set()
+
+    def _peek(self) -> t.Optional[RefreshItem]:
+        """Returns the next item, dropping outdated heap entries"""
+        while self._heap:
+            _, _, version, key = self._heap[0]
+            item = self._items.get(key)
+            if item is not None and item.version == version:
+                return item
+            heapq.heappop(self._heap)
+        return None
+
+    async def _run(self) -> None:
+        while True:
+            item = self._peek()
+            delay = None if item is None else item.due - time.monotonic()
+            if delay is None or delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            now = time.monotonic()
+            if item.decayed_popularity(now, self.interval(item.action)) < _MIN_POPULARITY:
+                del self._items[item.key]
+                continue
+
+            await self._semaphore.acquire()
+            task = asyncio.create_task(self._refresh(item))
+            self._refreshing.add(task)
+            task.add_done_callback(self._refreshing.discard)
+
+    async def _refresh(self, item: RefreshItem) -> None:
+        self.in_flight += 1
+        try:
+            if config.FETCH_JOBS:
+                await JobQueue.enqueue(item.action, item.user.type, item.user.id,
+                                       ScheduleTime.compute_timestamp(week_delta=item.week_delta)
+                                       if item.action == ActionStats.fetch_schedule else 0)
+            elif item.action == ActionStats.fetch_exams:
+                await self.service.fetch_exams(item.user)
+            else:
+                await self.service.fetch_schedule(item.user, week_delta=item.week_delta)
+            item.refreshed_at = time.monotonic()
+            self.refreshed += 1
+        except Exception:
+            self.failed += 1
+            logger.exception("Failed to refresh {} for {}", item.action.name, item.user)
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+        interval = self.interval(item.action)
+        popularity = item.decayed_popularity(time.monotonic(), interval)
+        # Rarely read items are refreshed half as often
+        factor = 1 if popularity >= 1 else 2
+        self._push(item, time.monotonic() + interval * factor * random.uniform(0.8, 1.0))
+
+    def status(self) -> dict[str, t.Any]:
+        item = self._peek()
+        lag = max(time.monotonic() - item.due, 0.0) if item is not None else 0.0
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "items": len(self._items),
+            "depth": len(self._items) - self.in_flight,
+            "lag": round(lag, 3),
+            "in_flight": self.in_flight,
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+        }
@@ -0,0 +1,87 @@
+import typing as t
+
+import orjson
+
+from app.models.db import ExamModel, ScheduleModel, ScheduleSubjectModel
+from app.models.enums import DayType
+
+__all__: t.Sequence[str] = ("build_week_snapshot", "build_week_document", "build_exams_document")
+
+
+def _people(model: t.Union[ScheduleSubjectModel, ExamModel]) -> dict[str, t.Any]:
+    return {
+        "group": {"id": model.group.id, "name": model.group.name},
+        "employee": {
+            "id": model.employee.id,
+            "name": model.employee.name,
+            "second_name": model.employee.second_name,
+            "middle_name": model.employee.middle_name,
+        },
+    }
+
+
+def _subject(s_m: ScheduleSubjectModel) -> dict[str, t.Any]:
+    """One subject of a week, queries._SUBJECT_OBJECT builds the same object in Postgres"""
+    return {
+        "name": s_m.name,
+        "type": s_m.type,
+        "number": s_m.number,
+        "sub_group": s_m.sub_group,
+        # Upstream sends the building as a string, the subject column is a number
+        "building": int(s_m.building),
+        "audience": s_m.audience,
+        "zoom_link": s_m.zoom_link,
+        "zoom_password": s_m.zoom_password,
+        **_people(s_m),
+    }
+
+
+def _week(week: int, days: t.Mapping[DayType, tuple[int, t.Iterable[ScheduleSubjectModel]]]) -> bytes:
+    return orjson.dumps({
+        "week": week,
+        "days": [
+            {
+                "day": day,
+                "date": days[day][0],
+                "subjects": [_subject(s_m) for s_m in sorted(days[day][1], key=lambda s_m: s_m.number)],
+            }
+            for day in DayType
+        ],
+    })
+
+
+def build_week_snapshot(week: int, subjects: t.Mapping[DayType, t.Iterable[ScheduleSubjectModel]]) -> bytes:
+    """Serializes a fetched week once at ingest time, the API returns these bytes as they are.
+
+    The subjects must carry the stored group names, see ScheduleService._use_stored_group_names.
+    """
+    return _week(week, {day: (week + 86400 * day, subjects.get(day, ())) for day in DayType})
+
+
+def build_week_document(week: int, days: t.Mapping[DayType, t.Optional[ScheduleModel]]) -> bytes:
+    """Serializes a week read from the database, same document as build_week_snapshot and queries.WEEK_DOCUMENT"""
+    return _week(week, {
+        day: (week + 86400 * day, ()) if days[day] is None else (days[day].date, days[day].subjects)
+        for day in DayType
+    })
+
+
+def build_exams_document(exams: t.Iterable[ExamModel]) -> bytes:
+    """Serializes exams read from the database, same document as queries.EXAMS_DOCUMENT"""
+    return orjson.dumps([
+        {
+            "id": e_m.id,
+            "day": e_m.day,
+            "date": e_m.date,
+            "name": e_m.name,
+            "sub_group": e_m.sub_group,
+            "dislocation": e_m.dislocation,
+            "number": e_m.number,
+            "type": e_m.type,
+            "time": e_m.time,
+            "zoom_link": e_m.zoom_link,
+            "zoom_password": e_m.zoom_password,
+            **_people(e_m),
+        }
+        for e_m in sorted(exams, key=lambda e_m: (e_m.date, e_m.number))
+    ])
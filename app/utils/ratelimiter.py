@@ -1,12 +1,14 @@
 from __future__ import annotations
 
+import abc
 import asyncio
 import enum
-import sys
 import time
-import traceback
 import typing as t
-from collections import deque
+
+from app.models.db import RateLimitModel
+
+__all__: t.Sequence[str] = ("BucketType", "RateLimitBackend", "MemoryBackend", "PostgresBackend", "RateLimiter")
 
 
 class BucketType(enum.IntEnum):
@@ -17,10 +19,139 @@ class BucketType(enum.IntEnum):
     TOKEN = 2
 
 
+class RateLimitBackend(abc.ABC):
+    """Storage of GCRA state: the theoretical arrival time (TAT) of every key.
+
+    The TAT is the moment the key's bucket becomes full again.
+    """
+
+    @abc.abstractmethod
+    async def reserve(self, key: t.Hashable, interval: float, period: float, block: bool) -> float:
+        """Atomically takes a slot for ``key`` and returns the delay before it may be used.
+
+        Returns -1 and takes nothing if ``block`` is False and no slot is available right now.
+        """
+
+    @abc.abstractmethod
+    async def peek(self, key: t.Hashable, interval: float, period: float) -> float:
+        """Returns the delay before a slot for ``key`` becomes available, without taking it."""
+
+    @abc.abstractmethod
+    async def release(self, key: t.Hashable, interval: float) -> None:
+        """Gives back a slot taken by :meth:`reserve`."""
+
+
+class MemoryBackend(RateLimitBackend):
+    """Process-local backend, idle keys are dropped once per ``sweep_every`` seconds."""
+
+    def __init__(self, sweep_every: float = 60) -> None:
+        self._bucket_data: dict[t.Hashable, float] = {}
+        self._sweep_every = sweep_every
+        self._next_sweep: float = time.monotonic() + sweep_every
+
+    def __len__(self) -> int:
+        return len(self._bucket_data)
+
+    def _sweep(self, now: float) -> None:
+        """Drops the keys whose buckets are full, they are equal to absent ones"""
+        self._next_sweep = now + self._sweep_every
+        self._bucket_data = {key: tat for key, tat in self._bucket_data.items() if tat > now}
+
+    def reserve_nowait(self, key: t.Hashable, interval: float, period: float, block: bool) -> float:
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
+
+        tat = max(self._bucket_data.get(key, now), now)
+        delay = tat + interval - period - now
+        if delay > 0 and not block:
+            return -1
+
+        self._bucket_data[key] = tat + interval
+        return max(delay, 0.0)
+
+    async def reserve(self, key: t.Hashable, interval: float, period: float, block: bool) -> float:
+        return self.reserve_nowait(key, interval, period, block)
+
+    async def peek(self, key: t.Hashable, interval: float, period: float) -> float:
+        now = time.monotonic()
+        tat = max(self._bucket_data.get(key, now), now)
+        return max(tat + interval - period - now, 0.0)
+
+    async def release(self, key: t.Hashable, interval: float) -> None:
+        if key in self._bucket_data:
+            self._bucket_data[key] -= interval
+
+
+class PostgresBackend(RateLimitBackend):
+    """Backend shared by every process using the database, one statement per call.
+
+    State lives in the ``ratelimit`` table; the database clock is used, so hosts do not need synced clocks
+    and the row lock taken by the upsert makes each reservation atomic.
+    """
+
+    _NOW = "extract(epoch FROM statement_timestamp())::float8"
+    _RESERVE = (
+        'INSERT INTO "ratelimit" AS r ("key", "tat") '
+        f"VALUES ($1, {_NOW} + $2::float8) "
+        'ON CONFLICT ("key") DO UPDATE '
+        f"SET \"tat\" = GREATEST(r.tat, {_NOW}) + $2::float8 "
+        f"WHERE $4::boolean OR GREATEST(r.tat, {_NOW}) + $2::float8 - $3::float8 <= {_NOW} "
+        f"RETURNING r.tat - $3::float8 - {_NOW}"
+    )
+    _PEEK = f'SELECT "tat" + $2::float8 - $3::float8 - {_NOW} FROM "ratelimit" WHERE "key" = $1'
+    _RELEASE = 'UPDATE "ratelimit" SET "tat" = "tat" - $2::float8 WHERE "key" = $1'
+    _SWEEP = f'DELETE FROM "ratelimit" WHERE "tat" < {_NOW}'
+
+    def __init__(self, namespace: str, sweep_every: float = 3600) -> None:
+        self.namespace = namespace
+        self._sweep_every = sweep_every
+        self._next_sweep: float = time.monotonic() + sweep_every
+
+    def _key(self, key: t.Hashable) -> str:
+        if isinstance(key, tuple):
+            key = ":".join(map(str, key))
+        return f"{self.namespace}:{key}"
+
+    async def _sweep(self) -> None:
+        now = time.monotonic()
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self._sweep_every
+        await RateLimitModel._meta.db.execute_query(self._SWEEP)
+
+    async def reserve(self, key: t.Hashable, interval: float, period: float, block: bool) -> float:
+        await self._sweep()
+        _, rows = await RateLimitModel._meta.db.execute_query(self._RESERVE,
+                                                              [self._key(key), interval, period, block])
+        if not rows:
+            return -1
+        return max(rows[0][0], 0.0)
+
+    async def peek(self, key: t.Hashable, interval: float, period: float) -> float:
+        _, rows = await RateLimitModel._meta.db.execute_query(self._PEEK, [self._key(key), interval, period])
+        return max(rows[0][0], 0.0) if rows else 0.0
+
+    async def release(self, key: t.Hashable, interval: float) -> None:
+        await RateLimitModel._meta.db.execute_query(self._RELEASE, [self._key(key), interval])
+
+
 class RateLimiter:
-    def __init__(self, period: float, limit: int, bucket: BucketType, wait: bool = True) -> None:
+    def __init__(
+            self,
+            period: float,
+            limit: int,
+            bucket: BucketType,
+            wait: bool = True,
+            backend: t.Optional[RateLimitBackend] = None
+    ) -> None:
         """Rate Limiter implementation for Airy
 
+        Implements GCRA (a token bucket storing a single timestamp per key):
+        each key may burst up to ``limit`` requests and then gets one request
+        every ``period / limit`` seconds. Acquiring is O(1) and waiters of a key are
+        served in arrival order.
+
         Parameters
         ----------
         period : float
@@ -32,82 +163,54 @@ class RateLimiter:
         wait : bool
             Determines if the ratelimiter should wait in
             case of hitting a ratelimit.
+        backend : RateLimitBackend
+            Where the buckets are stored, process memory by default.
+            Use PostgresBackend to share the limit between workers.
         """
         self.period: float = period
         self.limit: int = limit
         self.bucket: BucketType = bucket
-        self.wait: bool = False
+        self.wait: bool = wait
+        self.backend: RateLimitBackend = backend or MemoryBackend(sweep_every=period)
 
-        self._bucket_data = {}
+        self._interval: float = period / limit
 
-        # deque is basically a list optimized for append and pop at begin&end
-        self._queue: t.Deque[asyncio.Event] = deque()
-        self._task: t.Optional[asyncio.Task[t.Any]] = None
-
-    def _get_key(self, ctx) -> int:
+    def _get_key(self, ctx) -> t.Hashable:
         """Get key for cooldown bucket"""
 
-        keys = {
-            BucketType.GLOBAL: 0,
-            BucketType.USER: (ctx.id, ctx.type, ctx.object_id)
-        }
+        if self.bucket == BucketType.GLOBAL:
+            return 0
+        if self.bucket == BucketType.USER:
+            return ctx.id, ctx.type, ctx.object_id
+        return ctx if isinstance(ctx, str) else ctx.token
 
-        return keys[self.bucket]
+    async def retry_after(self, ctx) -> float:
+        """Seconds until the next request for ``ctx`` is allowed, 0 if it is allowed now."""
+        return await self.backend.peek(self._get_key(ctx), self._interval, self.period)
 
-    def is_rate_limited(self, ctx) -> bool:
+    async def is_rate_limited(self, ctx) -> bool:
         """Returns a boolean determining if the ratelimiter is ratelimited or not."""
-        now = time.monotonic()
-        key = self._get_key(ctx)
-
-        if bucket_item := self._bucket_data.get(key):
-            if bucket_item["reset_at"] <= now:
-                bucket_item["remaining"] = self.limit
-                bucket_item["reset_at"] = now + self.period
-                return False
-            return bucket_item["remaining"] <= 0
-
-        self._bucket_data[key] = {"reset_at": now + self.period, "remaining": self.limit}
-        return False
+        return await self.retry_after(ctx) > 0
 
-    async def acquire(self, ctx) -> None:
-        """Acquire a ratelimit, block execution if ratelimited and wait is True."""
-        event = asyncio.Event()
+    async def try_acquire(self, ctx) -> bool:
+        """Acquire a ratelimit if it is available right now."""
+        return await self.backend.reserve(self._get_key(ctx), self._interval, self.period, block=False) >= 0
 
-        self._queue.append(event)
+    async def acquire(self, ctx) -> bool:
+        """Acquire a ratelimit, block execution if ratelimited and wait is True.
 
-        if self._task is None:
-            self._task = asyncio.create_task(self._iter_queue(ctx))
-
-        if self.wait:
-            await event.wait()
-
-    async def _iter_queue(self, ctx) -> None:
-        try:
-            if not self._queue:
-                self._task = None
-                return
-
-            if self.is_rate_limited(ctx):
-                # Sleep until ratelimit expires
-                key = self._get_key(ctx)
-                bucket_item = self._bucket_data[key]
-                sleep_time = bucket_item["reset_at"] - time.monotonic()
-                await asyncio.sleep(sleep_time)
-
-            # Set events while not ratelimited
-            while not self.is_rate_limited(ctx) and self._queue:
-
-                key = self._get_key(ctx)
-
-                if bucket_item := self._bucket_data.get(key):
-                    bucket_item["remaining"] -= 1
-                else:
-                    self._bucket_data[key] = {"reset_at": time.monotonic() + self.period, "remaining": self.limit - 1}
-
-                self._queue.popleft().set()
-
-            self._task = None
+        Returns False if ratelimited and wait is False.
+        """
+        if not self.wait:
+            return await self.try_acquire(ctx)
 
-        except Exception as e:
-            print(f"Task Exception was never retrieved: {e}", file=sys.stderr)
-            print(traceback.format_exc(), file=sys.stderr)
+        key = self._get_key(ctx)
+        delay = await self.backend.reserve(key, self._interval, self.period, block=True)
+        if delay:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                # Give the slot back, so cancelled waiters do not delay the others
+                await asyncio.shield(self.backend.release(key, self._interval))
+                raise
+        return True
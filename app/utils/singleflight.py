@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import asyncio
+import typing as t
+
+T = t.TypeVar("T")
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution.
+
+    The call runs in its own task, so a cancelled caller does not cancel it for the others.
+    """
+
+    __slots__ = ("_calls", "calls", "coalesced")
+
+    def __init__(self) -> None:
+        self._calls: dict[t.Hashable, asyncio.Task[t.Any]] = {}
+        self.calls: int = 0
+        self.coalesced: int = 0
+
+    async def do(self, key: t.Hashable, func: t.Callable[[], t.Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+
+        return await asyncio.shield(task)
+
+    def _forget(self, key: t.Hashable, task: asyncio.Task[t.Any]) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Retrieve it, all the callers may have gone away
+            task.exception()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> dict[str, int]:
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": self.in_flight}
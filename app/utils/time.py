@@ -30,6 +30,11 @@ class ScheduleTime:
 
         return time + (cls.week_delta(week_delta)) * cls.time_week
 
+    @classmethod
+    def week_delta_of(cls, timestamp: int) -> int:
+        """Inverse of compute_timestamp for the start of a week"""
+        return round((timestamp - cls.compute_timestamp()) / cls.time_week)
+
     @classmethod
     def compute_datetime(cls, week_delta: int = 0):
         return datetime.fromtimestamp(cls.compute_timestamp(week_delta))
@@ -0,0 +1,126 @@
+"""Runs the fetch jobs queued in the fetch_job table
+
+python -m app.worker [--processes N] [--concurrency N]
+
+Every process takes jobs with its own connection pool and HTTP client, any number of them may run
+on any number of hosts sharing the database.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import signal
+import typing as t
+
+from cashews import cache
+from loguru import logger
+from tortoise import Tortoise
+
+import config
+from app.models.enums import ActionStats
+from app.services.jobs import FetchJob, JobQueue
+from app.services.schedule import ScheduleService, ScheduleUser
+from app.utils.time import ScheduleTime
+
+
+async def run_job(job: FetchJob) -> None:
+    user = ScheduleUser(job.type, job.object_id)
+    handlers: dict[ActionStats, t.Callable[[], t.Awaitable[t.Any]]] = {
+        ActionStats.fetch_schedule: lambda: ScheduleService.fetch_schedule(
+            user, week_delta=ScheduleTime.week_delta_of(job.week)),
+        ActionStats.fetch_exams: lambda: ScheduleService.fetch_exams(user),
+        ActionStats.fetch_faculties: lambda: ScheduleService.fetch_faculties(),
+        ActionStats.fetch_departments: lambda: ScheduleService.fetch_departments(job.object_id),
+        ActionStats.fetch_employees: lambda: ScheduleService.fetch_employees(job.object_id),
+        ActionStats.fetch_groups: lambda: ScheduleService.fetch_groups(job.object_id),
+    }
+    if job.action not in handlers:
+        raise ValueError(f"No handler for {job.action.name} jobs")
+    await handlers[job.action]()
+
+
+class Worker:
+    """Keeps up to ``concurrency`` jobs running, taking new ones as soon as some finish"""
+
+    def __init__(self, concurrency: int) -> None:
+        self.concurrency = concurrency
+        self.running: set[asyncio.Task[None]] = set()
+
+    async def run(self) -> None:
+        while True:
+            free = self.concurrency - len(self.running)
+            if not free:
+                await asyncio.wait(self.running, return_when=asyncio.FIRST_COMPLETED)
+                continue
+
+            jobs = await JobQueue.dequeue(free)
+            if not jobs:
+                await asyncio.sleep(config.JOB_POLL_INTERVAL)
+                continue
+
+            for job in jobs:
+                task = asyncio.create_task(self._run(job))
+                self.running.add(task)
+                task.add_done_callback(self.running.discard)
+
+    async def _run(self, job: FetchJob) -> None:
+        try:
+            await run_job(job)
+        except Exception as ex:
+            logger.exception("Job {} {} {} failed, attempt {}", job.id, job.action.name, job.object_id, job.attempts)
+            await JobQueue.fail(job, repr(ex))
+        else:
+            await JobQueue.complete(job)
+
+    async def stop(self) -> None:
+        """Lets the running jobs finish, jobs of a killed worker are taken again once their lease expires"""
+        if self.running:
+            await asyncio.wait(self.running)
+
+
+async def serve(concurrency: int) -> None:
+    cache.setup(config.CACHE_URL)
+    await Tortoise.init(config=config.tortoise_config)
+    await ScheduleService.init()
+    worker = Worker(concurrency)
+
+    main = asyncio.current_task()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, main.cancel)
+
+    logger.info("Worker started, {} jobs at once", concurrency)
+    try:
+        await worker.run()
+    except asyncio.CancelledError:
+        logger.info("Worker stopping")
+    finally:
+        await worker.stop()
+        await ScheduleService.shutdown()
+        await Tortoise.close_connections()
+
+
+def _process(concurrency: int) -> None:
+    asyncio.run(serve(concurrency))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Runs the queued fetch jobs")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=config.SCHEDULER_CONCURRENCY,
+                        help="jobs in flight per process")
+    args = parser.parse_args()
+
+    if args.processes == 1:
+        _process(args.concurrency)
+        return
+
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_process, args=(args.concurrency,)) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
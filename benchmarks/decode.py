@@ -0,0 +1,78 @@
+"""Compares pydantic parse_obj with the slotted records of app.services.schedule.decode
+
+Checks that both produce the same values first. Run from the repository root: python -m benchmarks.decode
+"""
+import random
+import time
+
+from app.services.schedule.decode import ExamRecord, ScheduleEntryRecord
+from app.services.schedule.models import ExamHTTP, ScheduleEntryHTTP
+
+TYPES = ("лек", "пр", "лаб", "зачет", "экзамен", "консультация")
+
+
+def schedule_entries(count: int) -> list[dict]:
+    return [{
+        "id_cell": str(i),
+        "TitleSubject": "Математический анализ",
+        "TypeLesson": random.choice(TYPES[:3]),
+        "idSubject": random.randrange(5000),
+        "title": "22-ПГ-1",
+        "special": "Кафедра",
+        "DateLesson": f"2023-02-{random.randrange(1, 29):02}",
+        "DayWeek": random.randrange(1, 7),
+        "NumberSubGruop": random.randrange(3),
+        "Korpus": str(random.randrange(1, 20)),
+        "NumberRoom": "101",
+        "NumberLesson": random.randrange(1, 8),
+        "employee_id": random.randrange(3000),
+        "Name": "Иван",
+        "Family": "Иванов",
+        "SecondName": "Иванович",
+        "idGruop": random.randrange(2000),
+        "zoom_link": None if i % 2 else "https://zoom.us/j/1",
+    } for i in range(count)]
+
+
+def exams(count: int) -> list[dict]:
+    return [{
+        "foto_link": "",
+        "id_cell": str(i),
+        "TitleSubject": "Математический анализ",
+        "TypeLesson": random.choice(TYPES[3:]),
+        "DateLesson": f"{random.randrange(1, 29):02}.06.2023",
+        "DayWeek": random.randrange(1, 7),
+        "NumberSubGruop": 0,
+        "NumberRoom": "101",
+        "NumberLesson": random.randrange(1, 8),
+        "Time": "10:00",
+        "employee_id": random.randrange(3000),
+        "Name": "Иван",
+        "Family": "Иванов",
+        "SecondName": "Иванович",
+        "idGruop": random.randrange(2000),
+    } for i in range(count)]
+
+
+def measure(parse, rows: list[dict], rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for raw in rows:
+            parse(raw)
+    return (time.perf_counter() - start) / (rounds * len(rows))
+
+
+def main() -> None:
+    for name, rows, model, record in (("schedule", schedule_entries(10_000), ScheduleEntryHTTP, ScheduleEntryRecord),
+                                      ("exams", exams(10_000), ExamHTTP, ExamRecord)):
+        for raw in rows:
+            assert model.parse_obj(raw).dict() == record.parse_obj(raw).dict(), raw
+
+        slow = measure(model.parse_obj, rows, rounds=3)
+        fast = measure(record.parse_obj, rows, rounds=3)
+        print(f"{name:>8} pydantic={slow * 1e6:>6.2f} us/row records={fast * 1e6:>6.2f} us/row "
+              f"speedup={slow / fast:>5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Microbenchmarks of app.utils.ratelimiter.RateLimiter with the in-memory backend
+
+Run from the repository root: python -m benchmarks.ratelimiter
+"""
+import asyncio
+import time
+
+from app.utils.ratelimiter import BucketType, RateLimiter
+
+
+async def bench_try_acquire(keys: int, rounds: int) -> None:
+    limiter = RateLimiter(period=60, limit=10, bucket=BucketType.TOKEN, wait=False)
+    tokens = [f"token-{i}" for i in range(keys)]
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for token in tokens:
+            await limiter.try_acquire(token)
+    elapsed = time.perf_counter() - start
+
+    ops = keys * rounds
+    print(f"try_acquire  keys={keys:>7} ops={ops:>8} {ops / elapsed:>12,.0f} ops/s "
+          f"{elapsed / ops * 1e9:>6.0f} ns/op")
+
+
+async def bench_acquire_wait(keys: int, per_key: int) -> None:
+    limiter = RateLimiter(period=0.01, limit=per_key, bucket=BucketType.TOKEN, wait=True)
+    tokens = [f"token-{i}" for i in range(keys)]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(limiter.acquire(token) for token in tokens for _ in range(per_key * 2)))
+    elapsed = time.perf_counter() - start
+
+    ops = keys * per_key * 2
+    print(f"acquire/wait keys={keys:>7} ops={ops:>8} {ops / elapsed:>12,.0f} ops/s "
+          f"{elapsed:>6.2f} s total, half of the calls waited")
+
+
+def main() -> None:
+    for keys in (100, 10_000, 100_000):
+        asyncio.run(bench_try_acquire(keys, rounds=max(1, 1_000_000 // keys)))
+    for keys in (100, 10_000):
+        asyncio.run(bench_acquire_wait(keys, per_key=5))
+
+
+if __name__ == "__main__":
+    main()
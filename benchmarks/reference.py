@@ -0,0 +1,58 @@
+"""Compares the pydantic and the .values() paths of the reference list endpoints
+
+Checks that both produce the same JSON first, on an in-memory SQLite database.
+Run from the repository root: python -m benchmarks.reference
+"""
+import asyncio
+import time
+import tracemalloc
+
+import orjson
+from tortoise import Tortoise
+
+from app.models.db import FacultyModel, GroupModel
+from app.models.enums import EducationalLevel, Years
+from app.services.reference import load_models, load_values
+
+
+async def populate(groups: int) -> None:
+    await FacultyModel.create(id=1, title="Faculty", short_title="F")
+    await GroupModel.bulk_create([GroupModel(id=i,
+                                             direction="09.03.04",
+                                             course=Years.First,
+                                             level=EducationalLevel.Undergraduate,
+                                             name=f"22-ПГ-{i}",
+                                             faculty_id=1) for i in range(groups)])
+
+
+async def measure(load, rounds: int) -> tuple[float, int]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        orjson.dumps(await load("groups", 1))
+    elapsed = (time.perf_counter() - start) / rounds
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+async def main() -> None:
+    await Tortoise.init(db_url="sqlite://:memory:", modules={"main": ["app.models.db"]})
+    await Tortoise.generate_schemas()
+    try:
+        for groups in (100, 1000):
+            await GroupModel.all().delete()
+            await FacultyModel.all().delete()
+            await populate(groups)
+            for kind, object_id in (("faculties", None), ("groups", 1)):
+                assert (orjson.dumps(await load_models(kind, object_id))
+                        == orjson.dumps(await load_values(kind, object_id))), kind
+            for name, load in (("pydantic", load_models), ("values", load_values)):
+                elapsed, peak = await measure(load, rounds=20)
+                print(f"{name:>8} rows={groups:>5} {elapsed * 1e3:>8.2f} ms/request peak={peak / 1024:>8.0f} KiB")
+    finally:
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+"""Import time of the application modules and cost of the startup steps
+
+Every module is imported in a fresh interpreter with -X importtime, the heaviest top level packages
+are listed. With BENCH_DB_URL set, connecting and schema generation are timed too.
+Run from the repository root: python -m benchmarks.startup
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+MODULES = ("main", "app.api", "app.services.schedule", "app.services.schedule.api")
+# Needed only to refresh cookies, must not be imported on startup
+LAZY = ("selenium", "fake_useragent")
+TOP = 10
+
+
+def import_profile(module: str) -> tuple[float, dict[str, int]]:
+    """Wall time of the import and cumulative microseconds per top level package"""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    packages: dict[str, int] = defaultdict(int)
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        # Top level entries only, nested ones are indented and already in their parent's cumulative time
+        name = name.removeprefix(" ")
+        if not name.startswith(" ") and "." not in name:
+            packages[name] += int(cumulative)
+    return elapsed, packages
+
+
+async def startup_steps(db_url: str) -> None:
+    from tortoise import Tortoise
+
+    start = time.perf_counter()
+    await Tortoise.init(db_url=db_url, modules={"main": ["app.models.db"]})
+    connected = time.perf_counter()
+    await Tortoise.generate_schemas(safe=True)
+    generated = time.perf_counter()
+    await Tortoise.close_connections()
+    print(f"tortoise init {(connected - start) * 1e3:>8.1f} ms, "
+          f"generate_schemas {(generated - connected) * 1e3:>8.1f} ms")
+
+
+def main() -> None:
+    for module in MODULES:
+        try:
+            elapsed, packages = import_profile(module)
+        except RuntimeError as ex:
+            print(f"{module}: import failed: {ex}")
+            continue
+
+        lazy = [name for name in LAZY if name in packages]
+        print(f"{module}: {elapsed * 1e3:.0f} ms wall, {sum(packages.values()) / 1e3:.0f} ms imports"
+              + (f", imports {', '.join(lazy)} eagerly" if lazy else ""))
+        for name, cumulative in sorted(packages.items(), key=lambda item: -item[1])[:TOP]:
+            print(f"    {name:<24} {cumulative / 1e3:>8.1f} ms")
+
+    if "BENCH_DB_URL" in os.environ:
+        asyncio.run(startup_steps(os.environ["BENCH_DB_URL"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,16 @@ import datetime
 
 from pydantic import BaseSettings
 
+from app.models.enums import ActionStats
+
 
 class ApiConfig(BaseSettings):
     token: str
     has_display: bool
     chrome_driver_dir: str
+    # Create missing tables and apply app/models/migrations.py on startup,
+    # off by default so workers boot without schema introspection
+    migrate: bool = False
 
     class Config:
         env_file = ".env"
@@ -30,14 +35,104 @@ db = DatabaseConfig()
 
 UNABLE_RATE_LIMIT = True
 
+# Outbound budget towards oreluniver.ru: UPSTREAM_RATE_LIMIT requests per UPSTREAM_RATE_PERIOD seconds.
+# "postgres" shares the budget between all workers and hosts, "memory" applies it per process
+UPSTREAM_RATE_PERIOD = 1.0
+UPSTREAM_RATE_LIMIT = 10
+RATE_LIMIT_BACKEND = "memory"
+
 UPDATE_FETCH_SCHEDULE = datetime.timedelta(hours=3)
 UPDATE_FETCH_EXAMS = datetime.timedelta(hours=3)
 UPDATE_FETCH_FACULTIES = datetime.timedelta(hours=24)
 UPDATE_FETCH_DEPARTMENTS = datetime.timedelta(hours=24)
 UPDATE_FETCH_EMPLOYEES = datetime.timedelta(hours=24)
+UPDATE_FETCH_GROUPS = datetime.timedelta(hours=24)
 UPDATE_FETCH_EMPLOYEE = datetime.timedelta(hours=3)
 UPDATE_FETCH_DATA = datetime.timedelta(days=180)
 
+# Keep a row in the stats table for every fetch, freshness checks only use the last_update table
+STATS_AUDIT_LOG = True
+# Stats rows older than their retention are rolled up into stats_rollup per STATS_ROLLUP_BUCKET ("hour" or "day")
+STATS_RETENTION_DEFAULT = datetime.timedelta(days=30)
+STATS_RETENTION = {
+    ActionStats.fetch_schedule: datetime.timedelta(days=3),
+    ActionStats.fetch_exams: datetime.timedelta(days=3),
+    ActionStats.fetch_data: datetime.timedelta(days=365),
+}
+STATS_ROLLUP_BUCKET = "day"
+STATS_PRUNE_INTERVAL = datetime.timedelta(hours=1)
+
+# Response cache of the /api/v1 endpoints, e.g. "redis://localhost:6379/0" to share it between workers.
+# With mem:// every worker drops the reference lists others changed within SHARED_STATE_INTERVAL,
+# reads schedule ETags from the database and answers conditional exam requests only after building them
+CACHE_URL = "mem://"
+# Build reference lists from .values() rows instead of ORM instances and pydantic models
+FAST_RESPONSES = True
+# Decode schedule entries and exams with the slotted records of schedule/decode.py instead of pydantic
+FAST_DECODE = True
+# Let Postgres assemble the schedule and exam documents (json_agg), the API sends its bytes as they are
+DB_JSON_READS = False
+# Cache-Control max-age of the reference lists and of the schedules, clients revalidate with If-None-Match after it
+REFERENCE_MAX_AGE = 3600
+SCHEDULE_MAX_AGE = 300
+# Max groups or employees of one batch schedule request
+BATCH_SCHEDULE_MAX_IDS = 200
+
+# Cookies are refreshed COOKIE_REFRESH_BEFORE ahead of their expected expiry
+COOKIE_TTL = datetime.timedelta(hours=12)
+COOKIE_REFRESH_BEFORE = datetime.timedelta(minutes=30)
+COOKIE_RETRY_DELAY = datetime.timedelta(minutes=1)
+# Workers that do not own the cookies ask the owner for new ones through the cookie_request table,
+# the owner checks it this often
+COOKIE_REQUEST_POLL = datetime.timedelta(seconds=10)
+
+# Max background schedule/exam refreshes in flight, they also share the upstream budget
+SCHEDULER_CONCURRENCY = 4
+
+# Max fetches in flight during the reference data crawl, capped by the HTTP client pool size
+CRAWL_CONCURRENCY = 16
+# Serve employee schedules and exams from the rows stored by the group fetches once
+# ScheduleService.ingest_schedules / ingest_exams fetched every group without failures.
+# Upstream is still asked for employees not found in the stored rows.
+DERIVE_EMPLOYEE_DATA = True
+
+# Hand scheduled and bulk fetches to the fetch_job queue run by `python -m app.worker` instead of fetching inline.
+# Workers are separate processes, CACHE_URL must then point to a shared cache (e.g. redis://)
+FETCH_JOBS = False
+# Seconds a worker holds a job before it is considered crashed and the job is taken again
+JOB_LEASE = 600.0
+# Failed jobs are retried after JOB_RETRY_BASE * 2 ** (attempt - 1) seconds, at most JOB_RETRY_MAX
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BASE = 30.0
+JOB_RETRY_MAX = 3600.0
+# Seconds an idle worker waits before polling the queue again
+JOB_POLL_INTERVAL = 1.0
+# Done and failed jobs are deleted by RetentionService this long after they finished
+JOB_RETENTION = datetime.timedelta(days=7)
+
+# Advisory lock electing the worker that runs crawls, cookie refresh, scheduled fetches and stats pruning.
+# The leader checks its lock and the other workers try to take it every LEADER_CHECK_INTERVAL seconds
+LEADER_LOCK_ID = 7351
+LEADER_CHECK_INTERVAL = 5.0
+# Seconds between the syncs of every worker with the others: fetches recorded in last_update are loaded
+# and the schedule reads of the followers are handed to the leader through the schedule_read table
+SHARED_STATE_INTERVAL = 10.0
+
+# Pause before the background data crawl is retried after a failure
+CRAWL_RETRY_DELAY = datetime.timedelta(minutes=5)
+
+# Merge schedule subjects, exams and snapshots of concurrent fetches in batches through binary COPY
+BULK_INGEST = True
+# A batch is merged once it holds INGEST_BATCH_ROWS rows or INGEST_FLUSH_DELAY seconds after its first row
+INGEST_BATCH_ROWS = 5000
+INGEST_FLUSH_DELAY = 0.05
+# Fetches wait while this many rows of a table are not committed yet
+INGEST_MAX_PENDING = 50000
+# The leader fetches the INGEST_WEEKS (week deltas) and the exams of every group each INGEST_INTERVAL
+# with ScheduleService.ingest_schedules and ingest_exams, None turns it off
+INGEST_INTERVAL = datetime.timedelta(hours=3)
+INGEST_WEEKS = (0, 1)
+
 # Constants for calculating time
 START_SEMESTER = int(datetime.datetime(2022, 8, 29).timestamp())
 BASE_WEEK_DELTA = 0
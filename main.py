@@ -3,16 +3,24 @@ import uvicorn
 
 from fastapi import FastAPI, Depends, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from starlette.responses import JSONResponse, RedirectResponse
 from tortoise.contrib.fastapi import register_tortoise
 from cashews import cache
 
+from app.models.migrations import migrate
+from app.services.leader import LeaderService
+from app.services.retention import RetentionService
 from app.services.schedule import ScheduleService
-from config import tortoise_config
+from config import api, tortoise_config, CACHE_URL
 from app.api import router
+from app.api.health import router as health_router
 
-app = FastAPI()
+cache.setup(CACHE_URL)
+
+app = FastAPI(default_response_class=ORJSONResponse)
 app.include_router(router)
+app.include_router(health_router)
 
 
 @app.get("/")
@@ -46,13 +54,33 @@ register_tortoise(
     app,
     config=tortoise_config,
     add_exception_handlers=True,
-    generate_schemas=True
+    generate_schemas=api.migrate
 )
 
 
+async def on_elected():
+    await ScheduleService.lead()
+    RetentionService.start()
+
+
+async def on_demoted():
+    RetentionService.stop()
+    ScheduleService.follow()
+
+
 @app.on_event("startup")
 async def startup_event():
+    # Runs after the startup handler of register_tortoise, which created the missing tables
+    if api.migrate:
+        await migrate()
     await ScheduleService.init()
+    LeaderService.start(on_elected, on_demoted)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await LeaderService.stop()
+    await ScheduleService.shutdown()
 
 if __name__ == '__main__':
     uvicorn.run(